@@ -0,0 +1,98 @@
+'''
+Import-time budget of the worker entrypoint, measured with python -X importtime
+
+    python bench/import_time.py                      # report of the worker imports
+    python bench/import_time.py --check              # exit code 1 over budget or if a deferred module is loaded
+    python bench/import_time.py --imports "from tools import Query" --top 20
+
+Each run is a fresh interpreter started in code/, the imports of code/main.py by default,
+and the best of --repeat runs is kept so a cold disk cache does not count against the budget.
+'''
+
+import json
+import os
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+
+# imports of code/main.py before its first API call
+WORKER_IMPORTS = "from google.cloud import bigquery; from tools import Directory, Table"
+
+# modules a worker must not load, they are only imported by the display and staging code paths
+DEFERRED = ('colorama', 'pygments', 'pygments_pprint_sql', 'google.cloud.storage')
+
+# modules a bare `import tools` must not load, google.cloud.bigquery itself imports pandas and pyarrow
+TOOLS_DEFERRED = DEFERRED + ('pandas', 'pyarrow', 'google.cloud.bigquery_storage')
+
+# budget (ms) of the worker imports
+BUDGET_MS = 1000
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(imports):
+    '''
+    Self and cumulative import time of every module loaded by the imports, in a fresh interpreter
+            Parameters:
+                    imports (str): python statements to run
+            Returns:
+                    modules (dict): module name -> {'self_ms', 'cumulative_ms', 'depth'}
+    '''
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", imports],
+                             cwd=CODE, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in process.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000,
+                             'depth': (len(indent) - 1) // 2}
+    return(modules)
+
+
+def report(imports, repeat=3, top=10, deferred=DEFERRED):
+    '''
+    Best of repeat runs: total import time, slowest top level modules and loaded deferred modules
+            Parameters:
+                    deferred* (tuple[str]): modules, with their submodules, that the imports must not load
+    '''
+    runs = [import_times(imports) for _ in range(repeat)]
+    modules = min(runs, key=lambda run: sum(row['self_ms'] for row in run.values()))
+    slowest = sorted(((name, row['cumulative_ms']) for name, row in modules.items() if row['depth'] == 0),
+                     key=lambda item: -item[1])[:top]
+    return({
+        'imports': imports,
+        'total_ms': round(sum(row['self_ms'] for row in modules.values()), 1),
+        'modules': len(modules),
+        'top': [{'module': name, 'cumulative_ms': round(ms, 1)} for name, ms in slowest],
+        'deferred_loaded': [name for name in modules
+                            if any(name == module or name.startswith(f"{module}.") for module in deferred)],
+    })
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--imports", type=str, help="statements to time", default=WORKER_IMPORTS)
+    parser.add_argument("--budget-ms", type=float, help="budget of the total import time", default=BUDGET_MS)
+    parser.add_argument("--repeat", type=int, help="fresh interpreters, the fastest is kept", default=3)
+    parser.add_argument("--top", type=int, help="slowest top level imports to report", default=10)
+    parser.add_argument("--check", action="store_true", help="exit code 1 over budget or if a deferred module is loaded")
+    args = parser.parse_args()
+
+    result = report(args.imports, args.repeat, args.top)
+    print(json.dumps(result, indent=1))
+    if args.check:
+        failures = []
+        if result['total_ms'] > args.budget_ms:
+            failures.append(f"import time {result['total_ms']}ms over the {args.budget_ms:.0f}ms budget")
+        if result['deferred_loaded'] and args.imports == WORKER_IMPORTS:
+            failures.append(f"deferred modules loaded by the worker: {', '.join(result['deferred_loaded'])}")
+        for failure in failures:
+            print(f"> OVER BUDGET {failure}")
+        print(f"> {len(failures)} failures (budget {args.budget_ms:.0f}ms)")
+        sys.exit(1 if failures else 0)
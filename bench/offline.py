@@ -0,0 +1,234 @@
+'''
+Offline benchmark suite: the launcher and code/tools against the fake clients of engine/fake.py
+
+    python bench/offline.py                                  # every scenario
+    python bench/offline.py --scenarios launch,gcs_transfer  # a subset
+    python bench/offline.py --check                          # compares with bench/baseline.json, exit code 1 on regression
+    python bench/offline.py --save                           # updates bench/baseline.json
+
+The fake clients sleep a fixed latency per API call and a fixed bandwidth per transfer stream,
+so the results depend on the number of calls and on their concurrency rather than on the machine.
+Only the serialization of the load scenario is CPU bound, use --scale to shrink its dataframe.
+'''
+
+import json
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'code'))
+
+from engine import FakeBigQuery, FakeCompute, FakeStorage, Launcher, registry, set_output  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return(None)
+    return(round(values[min(len(values) - 1, int(q / 100 * len(values)))], 4))
+
+
+def call_latency(service, method):
+    # p50/p99 of a method recorded by the instrumentation registry (bucket upper bounds)
+    for row in registry.to_dict()['histograms']:
+        if row['name'] == 'api_call_seconds' and row['labels'] == {'service': service, 'method': method}:
+            return(row['p50'], row['p99'])
+    return(None, None)
+
+
+#-------------------------------
+#        scenarios
+#-------------------------------
+
+def launch(workers=500):
+    '''
+    Launch of a 500 worker fleet, one insert per worker and batched operation polls
+    '''
+    compute = FakeCompute(latency=0.02, operation_time=0.5, seed=1)
+    launcher = Launcher(lambda: compute, "bench-project", "europe-west1-b", "n1-standard-1", "default", "sa",
+                        max_workers=16, poll_interval=0.25)
+    report = launcher.launch("#!/bin/bash\necho {var}", range(workers))
+    summary = report.summary()
+    return({
+        'throughput': summary['throughput_per_s'],
+        'unit': 'instances/s',
+        'p50_s': round(summary['latency_p50_s'], 4),
+        'p99_s': round(summary['latency_p99_s'], 4),
+        'wall_time_s': summary['wall_time_s'],
+        'failed': summary['failed'],
+        'calls': dict(compute.calls),
+    })
+
+
+def query_fanout(jobs=100):
+    '''
+    100 Query.to_table jobs submitted without waiting and tracked by one JobTracker
+    '''
+    from tools import Directory, JobTracker, Query, Table
+
+    client = FakeBigQuery(latency=0.02, job_time=1.0, job_jitter=0.5, seed=1)
+    table = Table(client, Directory(client, client.project, "bench"), "fanout")
+    tracker = JobTracker(client)
+    finished = {}
+    started = time.time()
+    for num in range(jobs):
+        query_job = Query(client, f"SELECT {num} AS var").to_table(table, table_suffix=str(num), sequence=False, tracker=tracker)
+        tracker.futures[query_job.job_id].add_done_callback(
+            lambda future, job_id=query_job.job_id: finished.setdefault(job_id, time.time()))
+    report = tracker.wait()
+    wall_time = time.time() - started
+    latencies = [finished[job_id] - job.created.timestamp() for job_id, job in tracker.jobs.items()]
+    return({
+        'throughput': round(jobs / wall_time, 2),
+        'unit': 'jobs/s',
+        'p50_s': percentile(latencies, 50),
+        'p99_s': percentile(latencies, 99),
+        'wall_time_s': round(wall_time, 3),
+        'failed': len(report['errors']),
+        'polls': report['polls'],
+        'calls': dict(client.calls),
+    })
+
+
+def dataframe_load(scale=1.0):
+    '''
+    1 GB dataframe loaded through Dataframe.to_table_staged (parquet chunks, parallel uploads, one load job)
+    '''
+    import numpy as np
+    import pandas as pd
+    from tools import Dataframe, Directory, Table
+
+    storage = FakeStorage(latency=0.02, bandwidth=100 * 2**20, keep_data=False)
+    client = FakeBigQuery(latency=0.02, load_throughput=500 * 2**20, storage=storage)
+    table = Table(client, Directory(client, client.project, "bench"), "load")
+    # 16 float64 columns, 128 bytes per row
+    rows = int(scale * 2**30 / 128)
+    dataframe = pd.DataFrame(np.random.default_rng(1).random((rows, 16)), columns=[f"c{num}" for num in range(16)])
+    loader = Dataframe(client, dataframe)
+    loader.to_table_staged(table, "bench-bucket", storage_client=storage, chunk_rows=max(1, rows // 16), upload_workers=8)
+    p50, p99 = call_latency('storage', 'upload')
+    return({
+        'throughput': loader.throughput['rows_per_s'],
+        'unit': 'rows/s',
+        'mb_per_s': loader.throughput['mb_per_s'],
+        'p50_s': p50,
+        'p99_s': p99,
+        'wall_time_s': loader.throughput['seconds'],
+        'rows': rows,
+        'calls': dict(sorted(list(client.calls.items()) + list(storage.calls.items()))),
+    })
+
+
+def gcs_transfer(files=200, size=2 * 2**20, workers=16):
+    '''
+    Bulk upload then download of 200 files of 2 MB with Bucket.upload_many and Bucket.download_many
+    '''
+    from tools import Bucket
+
+    storage = FakeStorage(latency=0.02, bandwidth=50 * 2**20, keep_data=False)
+    bucket = Bucket(storage, "bench-bucket")
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {}
+        for num in range(files):
+            path = os.path.join(directory, f"file-{num:04d}.bin")
+            with open(path, 'wb') as file:
+                file.write(os.urandom(size))
+            sources[path] = f"bench/file-{num:04d}.bin"
+        upload = bucket.upload_many(sources, workers=workers)
+        download = bucket.download_many({name: os.path.join(directory, 'out', os.path.basename(name))
+                                         for name in sources.values()}, workers=workers)
+    p50, p99 = call_latency('storage', 'upload')
+    return({
+        'throughput': round((upload['bytes'] + download['bytes']) / 2**20 / (upload['seconds'] + download['seconds']), 2),
+        'unit': 'MB/s',
+        'upload_mb_per_s': upload['mb_per_s'],
+        'download_mb_per_s': download['mb_per_s'],
+        'p50_s': p50,
+        'p99_s': p99,
+        'failed': len(upload['failures']) + len(download['failures']),
+        'calls': dict(storage.calls),
+    })
+
+
+SCENARIOS = {
+    'launch': launch,
+    'query_fanout': query_fanout,
+    'dataframe_load': dataframe_load,
+    'gcs_transfer': gcs_transfer,
+}
+
+
+#-------------------------------
+#        baseline
+#-------------------------------
+
+def compare(results, baseline, tolerance):
+    '''
+    Regressions of the results against the baseline: lower throughput, higher p99 or more API calls
+    A scenario run at another size than its baseline (dataframe_load with --scale) is skipped.
+    '''
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or 'error' in result:
+            continue
+        if result.get('rows') != reference.get('rows'):
+            print(f"> {name}: {result.get('rows')} rows, baseline {reference.get('rows')}, not compared")
+            continue
+        if result['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']} {result['unit']}, baseline {reference['throughput']}")
+        if result.get('p99_s') and reference.get('p99_s') and result['p99_s'] > reference['p99_s'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['p99_s']}s, baseline {reference['p99_s']}s")
+        calls, reference_calls = sum(result['calls'].values()), sum(reference['calls'].values())
+        if calls > reference_calls * (1 + tolerance):
+            regressions.append(f"{name}: {calls} API calls, baseline {reference_calls}")
+    return(regressions)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--scenarios", type=str, help="comma separated scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--scale", type=float, help="size of the dataframe_load dataframe, in GB", default=1.0)
+    parser.add_argument("--check", action="store_true", help="compare with the baseline, exit code 1 on regression")
+    parser.add_argument("--save", action="store_true", help="write the results to the baseline")
+    parser.add_argument("--tolerance", type=float, help="relative tolerance of the check", default=0.3)
+    parser.add_argument("--baseline", type=str, help="baseline file", default=BASELINE)
+    parser.add_argument("--verbose", action="store_true", help="keep the status lines of the tools")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        set_output('silent')
+    results = {}
+    for name in args.scenarios.split(','):
+        registry.reset()
+        kwargs = {'scale': args.scale} if name == 'dataframe_load' else {}
+        try:
+            results[name] = SCENARIOS[name](**kwargs)
+        except ImportError as e:
+            # the tools scenarios need the worker requirements, see code/requirements.txt
+            results[name] = {'error': f"skipped, {e}"}
+        print(json.dumps({name: results[name]}))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update({name: result for name, result in results.items() if 'error' not in result})
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=1, sort_keys=True)
+            file.write('\n')
+        print(f"> Baseline saved to {args.baseline}")
+    if args.check:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"> REGRESSION {regression}")
+        print(f"> {len(regressions)} regressions (tolerance {args.tolerance:.0%})")
+        sys.exit(1 if regressions else 0)
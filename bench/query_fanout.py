@@ -0,0 +1,53 @@
+'''
+Jobs per second and wall time of QueryTemplate against one job per value on a live query
+
+    python bench/query_fanout.py --project my-project --query "SELECT var, x FROM dataset.table WHERE var = @var" \
+        --values 0-99 --key-column var
+
+The single mode is the one-job-per-value loop. The array mode requires --key-column.
+'''
+
+import json
+import os
+import sys
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+
+def parse_values(values, param_type):
+    # 0-99 is a range, anything else a comma separated list
+    if param_type == 'INT64' and '-' in values and ',' not in values:
+        start, stop = values.split('-')
+        return(list(range(int(start), int(stop) + 1)))
+    values = values.split(',')
+    return([int(value) for value in values] if param_type == 'INT64' else values)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-p", "--project", type=str, help="id of the GCP project", required=True)
+    parser.add_argument("-q", "--query", type=str, help="query using the @var parameter", required=True)
+    parser.add_argument("--values", type=str, help="parameter values, ex: 0-99 or a,b,c", default="0-49")
+    parser.add_argument("--param-type", type=str, help="BigQuery type of the parameter", default="INT64")
+    parser.add_argument("--batch-size", type=int, help="values per job of the batched modes", default=50)
+    parser.add_argument("--key-column", type=str, help="column holding the value, enables the array mode", default=None)
+    parser.add_argument("--modes", type=str, help="comma separated modes to compare", default="single,union,script,array")
+    args = parser.parse_args()
+
+    from google.cloud import bigquery
+    from tools import QueryTemplate
+
+    client = bigquery.Client(args.project)
+    values = parse_values(args.values, args.param_type)
+    template = QueryTemplate(client, args.query, param_type=args.param_type, key_column=args.key_column)
+    rows = {}
+    for mode in args.modes.split(','):
+        if mode == 'array' and args.key_column is None:
+            continue
+        results = template.run(values, batch_size=args.batch_size, mode=mode)
+        report = dict(template.report, rows=sum(len(df) for df in results.values()))
+        rows[mode] = report['rows']
+        print(json.dumps(report))
+    if len(set(rows.values())) > 1:
+        print(f"> Row counts differ between the modes: {rows}")
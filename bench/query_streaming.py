@@ -0,0 +1,56 @@
+'''
+Peak memory of Query.to_df against Query.iter_batches on a live query
+
+    python bench/query_streaming.py --project my-project --query "SELECT * FROM dataset.big_table"
+
+Each mode runs in its own process so that the peak RSS of one doesn't hide the other.
+'''
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+
+def run(mode, project, query, max_rows, parallel_streams):
+    from google.cloud import bigquery
+    from tools import Query
+
+    started = time.time()
+    query = Query(bigquery.Client(project), query)
+    num_rows = 0
+    if mode == 'to_df':
+        num_rows = len(query.to_df())
+    else:
+        for chunk in query.iter_batches(max_rows=max_rows, parallel_streams=parallel_streams):
+            num_rows += len(chunk)
+    return({
+        'mode': mode,
+        'rows': num_rows,
+        'wall_time_s': round(time.time() - started, 3),
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-p", "--project", type=str, help="id of the GCP project", required=True)
+    parser.add_argument("-q", "--query", type=str, help="query to read", required=True)
+    parser.add_argument("--max-rows", type=int, help="rows per chunk of iter_batches", default=100000)
+    parser.add_argument("--parallel-streams", type=int, help="Storage Read API streams of iter_batches", default=1)
+    parser.add_argument("--mode", type=str, help="run a single mode in this process", choices=["to_df", "iter_batches"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.project, args.query, args.max_rows, args.parallel_streams)))
+    else:
+        for mode in ("to_df", "iter_batches"):
+            result = subprocess.run([sys.executable, __file__, "--mode", mode] + sys.argv[1:],
+                                    capture_output=True, text=True, check=True)
+            print(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,455 @@
+'''
+In-process instrumentation of the API calls
+Every call made through an instrumented client is counted and timed in the
+registry, along with the bytes billed by the jobs and the bytes transferred.
+The registry exports as JSON or Prometheus text, records spans on demand, and
+echo() replaces print() so that the status lines can go to structured logging
+or be silenced.
+Standard library only, the module ships in the worker image (python 3.8).
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import functools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("parallel_engine")
+
+
+#-------------------------------
+#        output
+#-------------------------------
+
+_output = {'mode': 'print'}
+_ansi = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    One JSON object per log record, the fields passed to echo() are top-level keys
+    '''
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return(json.dumps(entry, default=str))
+
+
+def set_output(mode:str = 'print', level:int = logging.INFO, stream=None):
+    '''
+    Switches the status lines of the tools and the launcher
+
+            Parameters:
+                    mode (str): 'print' for the colored lines, 'log' to send them to the parallel_engine logger,
+                                'json' to log them as JSON lines on stream, 'silent' to drop them
+                    level* (int): level of the parallel_engine logger in log and json modes
+                    stream* (file): stream of the json mode, default is sys.stderr
+    '''
+    assert mode in ('print', 'log', 'json', 'silent'), 'mode must be print, log, json or silent'
+    _output['mode'] = mode
+    if mode == 'json':
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        logger.handlers = [handler]
+        logger.propagate = False
+    if mode in ('log', 'json'):
+        logger.setLevel(level)
+
+
+def echo(*values, sep=' ', end='\n', level=logging.INFO, **fields):
+    '''
+    print() of the status lines, see set_output. fields are added to the structured records.
+    '''
+    mode = _output['mode']
+    if mode == 'print':
+        print(*values, sep=sep, end=end)
+        return
+    if mode == 'silent' or not logger.isEnabledFor(level):
+        return
+    message = _ansi.sub('', sep.join(str(value) for value in values)).strip()
+    # progress markers, ex: the ">" printed while a job is polled
+    if not message.strip('> '):
+        return
+    logger.log(level, message, extra={'fields': fields})
+
+
+#-------------------------------
+#        registry
+#-------------------------------
+
+class Histogram:
+    '''
+    Cumulative latency histogram
+            Parameters:
+                    buckets (list[float]): upper bounds of the buckets (s)
+    '''
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, value:float):
+        for num, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[num] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q:float):
+        '''
+        q-th percentile, interpolated in its bucket as histogram_quantile does, the max beyond the last bucket
+        '''
+        if not self.count:
+            return(None)
+        rank = q / 100 * self.count
+        seen, lower = 0, self.min
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return(round(lower + (upper - lower) * (rank - seen) / count, 6))
+            seen += count
+            lower = max(lower, bound)
+        return(round(self.max, 6))
+
+    def to_dict(self):
+        return({
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': dict(zip([str(bound) for bound in self.buckets], self.counts)),
+        })
+
+
+def _labels(labels):
+    return(tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+
+class Registry:
+    '''
+    Counters and latency histograms of the process
+            Parameters:
+                    buckets* (list[float]): bounds (s) of the latency histograms
+                    max_spans* (int): number of spans kept in memory
+    '''
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, buckets=default_buckets, max_spans=10000):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.jobs = set()
+        self.spans = deque(maxlen=max_spans)
+        self.record_spans = False
+        self.tracer = None
+        self.local = threading.local()
+
+    def inc(self, name:str, value:float = 1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(value)
+
+    def retry(self, operation:str, count:int = 1):
+        '''
+        Counts the retries of an operation, ex: a launch requeued after a QUOTA_EXCEEDED error
+        '''
+        self.inc('retries_total', count, operation=operation)
+
+    def transferred(self, service:str, direction:str, num_bytes:int):
+        self.inc('bytes_transferred_total', num_bytes, service=service, direction=direction)
+
+    def record_job(self, job):
+        '''
+        Adds the bytes billed by a finished BigQuery job, once per job
+        '''
+        billed = getattr(job, 'total_bytes_billed', None)
+        job_id = getattr(job, 'job_id', None)
+        if not billed or job_id is None or getattr(job, 'state', 'DONE') != 'DONE':
+            return
+        with self.lock:
+            if job_id in self.jobs:
+                return
+            self.jobs.add(job_id)
+        self.inc('bytes_billed_total', billed, service='bigquery')
+
+    @contextmanager
+    def call(self, service:str, method:str, **attributes):
+        '''
+        Times an API call: api_calls_total, api_call_seconds and a span if spans are enabled
+        '''
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            with self.span(f"{service}.{method}", **attributes):
+                yield
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            self.inc('api_calls_total', service=service, method=method, status=status)
+            self.observe('api_call_seconds', time.perf_counter() - started, service=service, method=method)
+
+    def enable_spans(self, tracer=None):
+        '''
+        Records spans in registry.spans, and forwards them to an OpenTelemetry tracer if one is given
+        or if opentelemetry is installed and configured
+        '''
+        self.record_spans = True
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+                tracer = trace.get_tracer("parallel_engine")
+            except ImportError:
+                tracer = None
+        self.tracer = tracer
+
+    def disable_spans(self):
+        self.record_spans = False
+        self.tracer = None
+
+    @contextmanager
+    def span(self, name:str, **attributes):
+        '''
+        Span of an operation, nested spans of the same thread share its trace id
+        '''
+        if not self.record_spans:
+            yield None
+            return
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        parent = stack[-1] if stack else None
+        span = {
+            'name': name,
+            'trace_id': parent['trace_id'] if parent else uuid.uuid4().hex,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': parent['span_id'] if parent else None,
+            'start': time.time(),
+            'attributes': attributes,
+        }
+        stack.append(span)
+        external = self.tracer.start_as_current_span(name, attributes=attributes) if self.tracer else None
+        started = time.perf_counter()
+        try:
+            if external is not None:
+                with external:
+                    yield span
+            else:
+                yield span
+        except Exception as e:
+            span['error'] = str(e)
+            raise
+        finally:
+            span['duration_s'] = round(time.perf_counter() - started, 6)
+            stack.pop()
+            self.spans.append(span)
+
+    def traced(self, name:str):
+        '''
+        Decorator running a function in a span, ex: @registry.traced('pipeline.run')
+        '''
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return(function(*args, **kwargs))
+            return(wrapper)
+        return(decorator)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.jobs.clear()
+            self.spans.clear()
+
+    def to_dict(self):
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [dict({'name': name, 'labels': dict(labels)}, **histogram.to_dict())
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return({'counters': counters, 'histograms': histograms, 'spans': list(self.spans)})
+
+    def to_json(self, path:str = None):
+        '''
+        Returns the registry as JSON, and writes it to path if set
+        '''
+        text = json.dumps(self.to_dict(), indent=1, default=str)
+        if path:
+            with open(path, 'w') as file:
+                file.write(text)
+        return(text)
+
+    def to_prometheus(self):
+        '''
+        Returns the registry in the Prometheus text exposition format
+        '''
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return('')
+            return('{' + ','.join('{}="{}"'.format(key, value.replace('"', '\\"')) for key, value in pairs) + '}')
+
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{labels_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{labels_text(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{labels_text(labels)} {histogram.count}")
+        return('\n'.join(lines) + '\n')
+
+    def summary(self):
+        '''
+        Calls, errors and latency percentiles per service and method
+        '''
+        rows = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if name == 'api_calls_total':
+                    row = rows.setdefault((labels['service'], labels['method']), {'calls': 0, 'errors': 0})
+                    row['calls'] += value
+                    row['errors'] += value if labels['status'] == 'error' else 0
+            for (name, labels), histogram in self.histograms.items():
+                labels = dict(labels)
+                if name == 'api_call_seconds':
+                    row = rows.setdefault((labels['service'], labels['method']), {'calls': 0, 'errors': 0})
+                    row.update(p50_s=histogram.percentile(50), p99_s=histogram.percentile(99),
+                               total_s=round(histogram.sum, 3))
+        return({f"{service}.{method}": row for (service, method), row in sorted(rows.items())})
+
+    def display(self):
+        for name, row in self.summary().items():
+            echo(f"> {name}: {row['calls']} calls, {row['errors']} errors, "
+                  f"p50 {row.get('p50_s')}s, p99 {row.get('p99_s')}s, total {row.get('total_s')}s")
+        with self.lock:
+            totals = {}
+            for (name, labels), value in self.counters.items():
+                if name != 'api_calls_total':
+                    totals[name] = totals.get(name, 0) + value
+        for name, value in sorted(totals.items()):
+            echo(f"> {name}: {value}")
+
+
+registry = Registry()
+
+
+#-------------------------------
+#        clients
+#-------------------------------
+
+class InstrumentedClient:
+    '''
+    Wraps a google client, each method call is recorded in the registry
+    The lazily paged results (list_blobs, list_jobs, list_tables, ...) are timed per page fetched,
+    as {method}.page, the call itself only creates the iterator.
+            Parameters:
+                    client (object): bigquery or storage client
+                    service (str): label of the calls, ex: bigquery
+                    registry* (Registry): defaults to the registry of the process
+    '''
+    def __init__(self, client, service:str, registry:Registry = registry):
+        self._client = client
+        self._service = service
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or name.startswith('_'):
+            return(attribute)
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            with self._registry.call(self._service, name):
+                result = attribute(*args, **kwargs)
+            self._registry.record_job(result)
+            self._page_timer(result, name)
+            return(result)
+        return(call)
+
+    def _page_timer(self, result, name):
+        # google.api_core page iterators fetch each page in _next_page, wrapped on the instance
+        next_page = getattr(result, '_next_page', None)
+        if next_page is None or not callable(next_page):
+            return
+
+        @functools.wraps(next_page)
+        def timed_next_page():
+            with self._registry.call(self._service, f"{name}.page"):
+                return(next_page())
+        try:
+            result._next_page = timed_next_page
+        except AttributeError:
+            pass
+
+    def __repr__(self):
+        return(f"InstrumentedClient({self._client!r})")
+
+
+def instrument(client, service:str = None):
+    '''
+    Instrumented client of a google client, the same wrapper is returned for the same client
+    The wrapper is kept on the client itself, so it lives as long as the client and no longer.
+
+            Parameters:
+                    client (object): bigquery or storage client, returned as is if None or already instrumented
+                    service* (str): label of the calls, defaults to the service attribute of the client
+                                    or to its package, ex: bigquery
+    '''
+    if client is None or isinstance(client, InstrumentedClient):
+        return(client)
+    wrapper = getattr(client, '_instrumented', None)
+    if not isinstance(wrapper, InstrumentedClient):
+        module = type(client).__module__
+        service = service or getattr(client, 'service', None) or module.split('.')[2 if module.startswith('google.cloud.') else 0]
+        wrapper = InstrumentedClient(client, service)
+        try:
+            client._instrumented = wrapper
+        except AttributeError:
+            # clients without a __dict__ get a new wrapper per call
+            pass
+    return(wrapper)
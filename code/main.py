@@ -1,11 +1,8 @@
-import pandas as pd
 from datetime import datetime
 import random
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 import warnings
 warnings.simplefilter("ignore")
-from tools import Directory, Table, Dataframe
-from google.cloud import bigquery
 
 # Parse command line arguments
 parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
@@ -13,9 +10,14 @@ parser.add_argument("-p", "--project", type=str, help="id of the GCP project")
 parser.add_argument("-d", "--dataset", type=str, help="name of the output BigQuery dataset", default="parallel_engine")
 parser.add_argument("-t", "--table", type=str, help="name of the BigQuery table", default = "logs")
 parser.add_argument("-v", "--var", type=int, help="any variable to be reflected in the output")
+parser.add_argument("-b", "--bucket", type=str, help="staging bucket, if set the rows are staged for a single ResultSink.commit instead of loaded by each worker", default=None)
 
 args = vars(parser.parse_args())
 
+# Only the bigquery client and the tools used below are imported, see bench/import_time.py for the budget
+from google.cloud import bigquery
+from tools import Directory, Table
+
 
 # Create the output dataset
 client = bigquery.Client(args["project"])
@@ -24,12 +26,25 @@ directory.create(location = "EU")
 
 table = Table(client, directory, "runner_logs")
 
-# Generate the DataFrame
-df = pd.DataFrame()
-df = df.append({"timestamp": datetime.now(), "id": random.randint(1,264), "var":args["var"]}, ignore_index=True)
-
-dataframe = Dataframe(client, df)
-dataframe.to_table(table, write_disposition="WRITE_APPEND")
-
-
-
+# Generate the results, runtime times the task alone for engine.RuntimeHistory
+task_start = datetime.now()
+# [UPDATE HERE]
+result = {"id": random.randint(1,264)}
+row = {"timestamp": datetime.now(), "id": result["id"], "var":args["var"], "runtime": (datetime.now() - task_start).total_seconds()}
+
+if args["bucket"]:
+    # Stage the rows, the coordinator loads every worker's files with ResultSink.commit
+    from tools import ResultSink
+
+    with ResultSink(client, args["bucket"], prefix=f"staging/{args['dataset']}/runner_logs") as sink:
+        sink.add(row)
+else:
+    import pandas as pd
+    from tools import Dataframe
+
+    df = pd.DataFrame()
+    df = df.append(row, ignore_index=True)
+    dataframe = Dataframe(client, df)
+    # runner_logs tables created before the runtime column need the field addition
+    dataframe.to_table(table, write_disposition="WRITE_APPEND",
+                       schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION])
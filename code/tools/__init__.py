@@ -0,0 +1,46 @@
+""" 
+              __             __                __
+  ____  _____/ /_____  _____/ /___  __  ______/ /
+ / __ \/ ___/ __/ __ \/ ___/ / __ \/ / / / __  / 
+/ /_/ / /__/ /_/ /_/ / /__/ / /_/ / /_/ / /_/ /  
+\____/\___/\__/\____/\___/_/\____/\__,_/\__,_/  
+"""
+
+#-------------------------------
+#        lazy submodules
+#-------------------------------
+
+# Every name is loaded from its submodule on first use, so a worker importing Directory and Table
+# does not pay for the query, storage or display dependencies it never calls.
+_submodules = {
+    'MetadataCache': 'metadata',
+    'Directory': 'directory',
+    'Table': 'directory',
+    'JobTracker': 'jobs',
+    'QueryCache': 'query',
+    'Query': 'query',
+    'QueryTemplate': 'query',
+    'Pipeline': 'pipeline',
+    'CostPlan': 'cost',
+    'CostPlanner': 'cost',
+    'Dataframe': 'dataframe',
+    'ResultSink': 'sink',
+    'new_storage_client': 'storage',
+    'Bucket': 'storage',
+}
+
+__all__ = list(_submodules)
+
+
+def __getattr__(name):
+    if name not in _submodules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(f"{__name__}.{_submodules[name]}"), name)
+    globals()[name] = value
+    return(value)
+
+
+def __dir__():
+    return(sorted(set(globals()) | set(__all__)))
@@ -0,0 +1,26 @@
+'''
+Colours of the status lines, colorama is only imported when a line is printed
+'''
+
+import importlib
+
+
+class _Lazy:
+    '''
+    Stand-in for a colorama palette (Fore, Back, Style) importing colorama on the first attribute access
+            Parameters:
+                    name (str): name of the palette in colorama
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._palette = None
+
+    def __getattr__(self, attribute):
+        if self._palette is None:
+            self._palette = getattr(importlib.import_module("colorama"), self._name)
+        return(getattr(self._palette, attribute))
+
+
+Fore = _Lazy("Fore")
+Back = _Lazy("Back")
+Style = _Lazy("Style")
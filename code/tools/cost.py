@@ -0,0 +1,225 @@
+'''
+Dry-run cost planning of queries and sweeps
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from google.cloud import bigquery
+from instrumentation import echo, instrument
+
+from ._display import Fore, Style
+from .query import Query, QueryTemplate
+
+
+def _param_type(value):
+    # BigQuery type of a python parameter value
+    if isinstance(value, bool):
+        return('BOOL')
+    if isinstance(value, int):
+        return('INT64')
+    if isinstance(value, float):
+        return('FLOAT64')
+    if isinstance(value, datetime):
+        return('TIMESTAMP' if value.tzinfo else 'DATETIME')
+    if isinstance(value, date):
+        return('DATE')
+    return('STRING')
+
+
+#-------------------------------
+#          Cost planner
+#-------------------------------
+
+class CostPlan:
+    '''
+    Estimated bytes and on-demand cost of a set of queries
+            Parameters:
+                    rows (list[dict]): one row per query, label, params, sql, bytes, cost_usd and error
+                    budget_usd* (float): budget the plan is checked against
+    '''
+    def __init__(self, rows, budget_usd=None):
+        self.rows = rows
+        self.budget_usd = budget_usd
+        self.trimmed = []
+
+    @property
+    def total_bytes(self):
+        return(sum(row['bytes'] or 0 for row in self.rows))
+
+    @property
+    def total_usd(self):
+        return(round(sum(row['cost_usd'] or 0 for row in self.rows), 4))
+
+    @property
+    def errors(self):
+        return([row for row in self.rows if row['error'] is not None])
+
+    @property
+    def params(self):
+        '''
+        Parameter sets of the planned queries, ex: the params to launch once the plan is approved
+        '''
+        return([row['params'] for row in self.rows])
+
+    def to_df(self):
+        import pandas as pd
+
+        return(pd.DataFrame(self.rows, columns=['label', 'params', 'bytes', 'cost_usd', 'error']))
+
+    def display(self):
+        for row in self.rows:
+            if row['error'] is not None:
+                echo(Fore.RED + f"> {row['label']}: dry run FAILED (ಠ_ಠ) {row['error']}" + Style.RESET_ALL)
+            else:
+                echo(f"> {row['label']}: {row['bytes'] / 2**30:.2f} GiB, ${row['cost_usd']:.4f}")
+        budget = f" (budget ${self.budget_usd})" if self.budget_usd is not None else ""
+        echo(Fore.MAGENTA + f"> Total: {len(self.rows)} queries, {self.total_bytes / 2**30:.2f} GiB, ${self.total_usd}{budget}")
+        if self.trimmed:
+            echo(f"> {len(self.trimmed)} queries trimmed to fit the budget")
+        echo(Style.RESET_ALL)
+
+
+class CostPlanner:
+    '''
+    Estimates the cost of many queries with concurrent dry runs, before anything is launched
+            Parameters:
+                    client (object): bigquery client
+                    budget_usd* (float): max on-demand cost of a plan, no check if None
+                    price_per_tib* (float): on-demand price (USD) per TiB processed
+                    max_workers* (int): number of dry runs sent at the same time
+    '''
+    # BigQuery bills at least 10 MB per query reading data
+    min_billed_bytes = 10 * 2**20
+
+    def __init__(self, client, budget_usd:float = None, price_per_tib:float = 6.25, max_workers:int = 16):
+        self.client = instrument(client)
+        self.budget_usd = budget_usd
+        self.price_per_tib = price_per_tib
+        self.max_workers = max_workers
+        self.dry_runs = {}
+        self.lock = threading.Lock()
+
+    def cost(self, num_bytes:int):
+        if not num_bytes:
+            return(0.0)
+        return(max(num_bytes, self.min_billed_bytes) / 2**40 * self.price_per_tib)
+
+    @staticmethod
+    def _key(sql:str, query_parameters):
+        return((sql, tuple((parameter.name, parameter.type_, parameter.value) for parameter in query_parameters or [])))
+
+    def dry_run(self, sql:str, query_parameters:list = None):
+        '''
+        Bytes processed by a query, the dry runs are cached per SQL text and query parameters
+        '''
+        key = self._key(sql, query_parameters)
+        with self.lock:
+            if key in self.dry_runs:
+                return(self.dry_runs[key])
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=query_parameters or [])
+        num_bytes = self.client.query(sql, job_config=job_config).total_bytes_processed  # Make an API request.
+        with self.lock:
+            self.dry_runs[key] = num_bytes
+        return(num_bytes)
+
+    def plan(self, queries:list, labels:list = None, params:list = None, query_parameters:list = None):
+        '''
+        Dry runs every query concurrently
+        
+                Parameters:
+                        queries (list[Query or str]): queries of the plan
+                        labels* (list[str]): names of the queries in the report, defaults to their position
+                        params* (list): parameter set of each query, returned by CostPlan.params
+                        query_parameters* (list[list[bigquery.ScalarQueryParameter]]): query parameters of each query
+
+                Returns:
+                        plan (CostPlan)
+        '''
+        sqls = [query.query if isinstance(query, Query) else query for query in queries]
+        labels = labels or [f"query {num}" for num in range(len(sqls))]
+        params = params or [None] * len(sqls)
+        query_parameters = query_parameters or [None] * len(sqls)
+        keys = [self._key(sql, parameters) for sql, parameters in zip(sqls, query_parameters)]
+        # each distinct query is dry run once
+        distinct = dict(zip(keys, zip(sqls, query_parameters)))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {key: executor.submit(self.dry_run, sql, parameters) for key, (sql, parameters) in distinct.items()}
+        rows = []
+        for label, param, sql, key in zip(labels, params, sqls, keys):
+            future = futures[key]
+            error = future.exception()
+            num_bytes = None if error is not None else future.result()
+            rows.append({
+                'label': label,
+                'params': param,
+                'sql': sql,
+                'bytes': num_bytes,
+                'cost_usd': None if error is not None else self.cost(num_bytes),
+                'error': None if error is None else str(error),
+            })
+        return(CostPlan(rows, self.budget_usd))
+
+    def plan_template(self, template, grid, param_types:dict = None):
+        '''
+        Dry runs a query template for every parameter set of a grid, the values are passed as query parameters
+        
+                Parameters:
+                        template (QueryTemplate or str): SQL with @name parameters, ex: "... WHERE var = @var"
+                        grid (list[dict]): parameter sets, ex: a Sweep, a single value is used as the template parameter (@var)
+                        param_types* (dict): BigQuery type of the parameters, defaults to the param_type of a QueryTemplate
+                            for its parameter and to the type of the python value otherwise
+
+                Returns:
+                        plan (CostPlan)
+        '''
+        if isinstance(template, QueryTemplate):
+            param_types = {template.name: template.param_type, **(param_types or {})}
+        else:
+            template = QueryTemplate(self.client, template)
+            param_types = param_types or {}
+        params = [value if isinstance(value, dict) else {template.name: value} for value in grid]
+        query_parameters = [
+            [bigquery.ScalarQueryParameter(name, param_types.get(name) or _param_type(value), value) for name, value in values.items()]
+            for values in params
+        ]
+        labels = [', '.join(f"{key}={value}" for key, value in value.items()) for value in params]
+        return(self.plan([template.query] * len(params), labels, params, query_parameters))
+
+    def gate(self, plan, on_exceed:str = 'refuse'):
+        '''
+        Checks a plan against the budget before launching it
+        
+                Parameters:
+                        plan (CostPlan): plan to check
+                        on_exceed* (str): 'refuse' raises a ValueError over budget or on a failed dry run,
+                                          'trim' drops the failed queries and, in order, the queries that no longer fit in the budget
+
+                Returns:
+                        plan (CostPlan): the approved plan
+        '''
+        assert on_exceed in ('refuse', 'trim'), 'on_exceed must be refuse or trim'
+        plan.budget_usd = self.budget_usd
+        if on_exceed == 'refuse':
+            if plan.errors:
+                plan.display()
+                raise ValueError(f"{len(plan.errors)} dry runs failed, the plan is refused")
+            if self.budget_usd is not None and plan.total_usd > self.budget_usd:
+                plan.display()
+                raise ValueError(f"Plan costs ${plan.total_usd}, over the ${self.budget_usd} budget")
+        else:
+            kept, spent = [], 0.0
+            for row in plan.rows:
+                if row['error'] is None and (self.budget_usd is None or spent + row['cost_usd'] <= self.budget_usd):
+                    kept.append(row)
+                    spent += row['cost_usd']
+                else:
+                    plan.trimmed.append(row)
+            plan.rows = kept
+        plan.display()
+        return(plan)
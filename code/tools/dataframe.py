@@ -0,0 +1,229 @@
+'''
+Loads of pandas dataframes to BigQuery
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import os
+import tempfile
+from datetime import datetime
+from time import sleep
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from google.cloud import bigquery
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+from .metadata import MetadataCache
+from .storage import new_storage_client
+
+
+#-------------------------------
+#          Dataframe
+#-------------------------------   
+
+def _write_parquet(chunk):
+    # module level so that it can be sent to a process pool
+    dataframe, path = chunk
+    dataframe.to_parquet(path, index=False)
+    return(path)
+
+
+class Dataframe:
+    def __init__(self, client, dataframe, cache=None):
+        self.client = instrument(client)
+        self.dataframe = dataframe
+        # destination tables and their schemas, see to_table(schema='existing')
+        self.cache = cache or MetadataCache.shared(client)
+        
+    def _check_job_state(self, query_job):
+        # Check on the progress by getting the job's updated state. Once the state
+        # is `DONE`, the results are ready.
+        query_job = self.client.get_job(
+            query_job.job_id, location=query_job.location
+        )  # Make an API request.
+        echo(f"> Job {query_job.job_id} is currently {query_job.state} ", end='')
+        while query_job.state=='RUNNING':
+            echo(">", end='')
+            query_job = self.client.get_job(
+                query_job.job_id, location=query_job.location
+                )  
+            sleep(0.5) 
+        echo(Fore.GREEN + f"\n> Query {query_job.state} (ಠ‿↼)") 
+        echo(Style.RESET_ALL)
+        
+    def _retrieve_job_metadata(self, query_job):
+        echo(Fore.MAGENTA + f"> Email: {query_job.user_email}")
+        echo(f"> Job time: {query_job.created}")
+        echo(Style.RESET_ALL)
+    
+    def to_table(self, endpoint, table_suffix="", write_disposition='WRITE_TRUNCATE', sequence=True, tracker=None, schema=None,
+                 schema_update_options=None):
+        '''
+        Transfers the results of the dataframe to a bigquery table
+        
+                Parameters:
+                        endoint: (Talbe obj)
+                        table_suffix: (str) 
+                        write_disposition: (str) default is set to 'WRITE_TRUNCATE'
+                        sequence: (bool) If set to False, the job won't wait for validation        
+                        tracker: (JobTracker) if set and sequence is False, the job is tracked instead of awaited
+                        schema: (list[bigquery.SchemaField] or 'existing') explicit schema to skip type detection,
+                            'existing' reuses the schema of the destination table
+                        schema_update_options: (list[str]) ex: [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+                            to append columns missing from the destination table
+        ''' 
+        if not sequence and tracker is None:
+            echo(Fore.RED + f"\n> Sequencing is deactivated, job status wont be verified" + Style.RESET_ALL) 
+        #if there is a table suffix, a sperator must be added
+        if len(table_suffix) > 0 and '$' not in table_suffix :
+            table_suffix = "_" + str(table_suffix)
+            
+        table_id = f'{endpoint.project}.{endpoint.dataset}.{endpoint.table}{table_suffix}'
+        
+        job_config = bigquery.LoadJobConfig(
+            # Optionally, set the write disposition. BigQuery appends loaded rows
+            # to an existing table by default, but with WRITE_TRUNCATE write
+            # disposition it replaces the table with the loaded data.
+            write_disposition=write_disposition,
+        )
+        if schema_update_options:
+            job_config.schema_update_options = schema_update_options
+        # Specify a (partial) schema. All columns are always written to the
+        # table. The schema is used to assist in data type definitions.
+        schema = self._schema(table_id, schema)
+        if schema:
+            job_config.schema = schema
+        echo(f'> Exporting dataframe to table {table_id}')
+        job = self.client.load_table_from_dataframe(
+            self.dataframe, table_id, job_config=job_config
+        )  # Make an API request.
+        self.cache.invalidate(table_id)
+        if sequence:
+            
+            job = self.client.get_job(
+                job.job_id, location=job.location
+            )  # Make an API request.
+        
+            self._check_job_state(job)
+            self._retrieve_job_metadata(job)        
+            self.cache.invalidate(table_id)
+            table = self.cache.get_table(table_id)  # Make an API request.
+
+            echo(
+                "Loaded {} rows and {} columns to {}".format(
+                    table.num_rows, len(table.schema), table_id
+                )
+            )
+            return(job)
+        if tracker is not None:
+            tracker.add(job, label=table_id)
+        return(job)
+
+    def _schema(self, table_id, schema):
+        # 'existing' reuses the schema of the destination table, kept in the metadata cache
+        if schema != 'existing':
+            return(schema)
+        return(self.cache.schema(table_id))  # Make an API request if not cached.
+
+    @registry.traced('dataframe.to_table_staged')
+    def to_table_staged(
+        self,
+        endpoint,
+        bucket_name: str,
+        prefix: str = "staging",
+        table_suffix: str = "",
+        write_disposition: str = 'WRITE_TRUNCATE',
+        schema = None,
+        chunk_rows: int = 500000,
+        processes: int = None,
+        upload_workers: int = 8,
+        storage_client = None,
+        cleanup: bool = True
+        ):
+        '''
+        Transfers a large dataframe to a bigquery table through parquet files staged in a bucket
+        The chunks are serialized in a process pool, uploaded in parallel and committed with a single load job
+        
+                Parameters:
+                        endpoint: (Table obj)
+                        bucket_name: (str) staging GCS bucket, in the location of the dataset
+                        prefix: (str) staging folder in the bucket
+                        table_suffix: (str)
+                        write_disposition: (str) default is set to 'WRITE_TRUNCATE'
+                        schema: (list[bigquery.SchemaField] or 'existing') explicit schema, 'existing' reuses the destination table schema
+                        chunk_rows: (int) number of rows per parquet file
+                        processes: (int) serialization processes, defaults to the number of cores
+                        upload_workers: (int) number of parallel uploads
+                        storage_client: (storage.Client) defaults to a client on the bigquery client project
+                        cleanup: (bool) if set to True, deletes the staged files once loaded
+        '''
+        if len(self.dataframe) == 0:
+            # no parquet file would match the wildcard uri, the empty frame is loaded directly to apply the
+            # write disposition and create the table from its columns
+            echo('> Empty dataframe, loaded without staging')
+            return(self.to_table(endpoint, table_suffix, write_disposition, schema=schema))
+        if len(table_suffix) > 0 and '$' not in table_suffix :
+            table_suffix = "_" + str(table_suffix)
+        table_id = f'{endpoint.project}.{endpoint.dataset}.{endpoint.table}{table_suffix}'
+        storage_client = instrument(storage_client or new_storage_client(self.client.project))
+        bucket = storage_client.bucket(bucket_name)
+        folder = f"{prefix.strip('/')}/{table_id}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        started = datetime.now()
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Serialize the chunks in parallel
+            chunks = [
+                (self.dataframe.iloc[start:start + chunk_rows], os.path.join(directory, f"chunk-{num:05d}.parquet"))
+                for num, start in enumerate(range(0, len(self.dataframe), chunk_rows))
+            ]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                paths = list(executor.map(_write_parquet, chunks))
+            num_bytes = sum(os.path.getsize(path) for path in paths)
+            echo(f'> Serialized {len(self.dataframe)} rows in {len(paths)} parquet files ({num_bytes} bytes)')
+
+            # Upload the chunks in parallel
+            def upload(path):
+                with registry.call('storage', 'upload'):
+                    bucket.blob(f"{folder}/{os.path.basename(path)}").upload_from_filename(path)
+                registry.transferred('storage', 'upload', os.path.getsize(path))
+            with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+                list(executor.map(upload, paths))
+            echo(f'> Staged {len(paths)} files in gs://{bucket_name}/{folder}')
+
+        # Commit every chunk with a single load job
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=write_disposition,
+        )
+        schema = self._schema(table_id, schema)
+        if schema:
+            job_config.schema = schema
+        echo(f'> Loading gs://{bucket_name}/{folder}/*.parquet to table {table_id}')
+        job = self.client.load_table_from_uri(
+            f"gs://{bucket_name}/{folder}/*.parquet", table_id, job_config=job_config
+        )  # Make an API request.
+        try:
+            with registry.call('bigquery', 'load'):
+                job.result()  # Waits for job to complete.
+        finally:
+            self.cache.invalidate(table_id)
+            if cleanup:
+                for blob in storage_client.list_blobs(bucket_name, prefix=f"{folder}/"):
+                    blob.delete()
+
+        elapsed = (datetime.now() - started).total_seconds()
+        self.throughput = {
+            'rows': len(self.dataframe),
+            'bytes': num_bytes,
+            'files': len(paths),
+            'seconds': round(elapsed, 3),
+            'rows_per_s': round(len(self.dataframe) / elapsed, 1) if elapsed else None,
+            'mb_per_s': round(num_bytes / 1024**2 / elapsed, 2) if elapsed else None,
+        }
+        echo(Fore.GREEN + f"> Loaded {len(self.dataframe)} rows to {table_id} (ಠ‿↼)")
+        echo(Fore.MAGENTA + f"> {self.throughput['rows_per_s']} rows/s, {self.throughput['mb_per_s']} MB/s")
+        echo(Style.RESET_ALL)
+        return(job)
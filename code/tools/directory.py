@@ -0,0 +1,272 @@
+'''
+BigQuery datasets and tables
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from google.cloud import bigquery
+from instrumentation import echo, instrument, registry
+
+from .metadata import MetadataCache
+from .storage import Bucket, new_storage_client
+
+
+#-------------------------------
+#        diretory
+#-------------------------------
+
+class Directory:
+    '''
+    Creates BigQuery directory
+            Parameters:
+                    project (str): Name of the project
+                    dataset (str): Name of the dataset
+                    cache* (MetadataCache): defaults to the cache shared by the client
+    '''
+    def __init__(self, client, project, dataset, cache=None):
+        self.project = project
+        self.dataset = dataset
+        self.client = instrument(client)
+        self.dataset_id = f'{self.project}.{self.dataset}'
+        self.cache = cache or MetadataCache.shared(client)
+    
+    def check_if_exist(self):
+        if self.cache.dataset_exists(self.dataset_id):  # Make an API request if not cached.
+            echo("Dataset {} already exists".format(self.dataset))
+            return(True)
+        echo("Dataset {} is not found".format(self.dataset))
+        return(False)
+    
+    def create(self, location:str, exists_ok=True):
+        '''
+        Create a dataset in BigQuery 
+        
+                Parameters:
+                        location (str): dataset location 
+                        exists_ok (bool): default = True, ignore already exists errors when creating the dataset
+                        
+        '''
+        if exists_ok and self.cache.peek('dataset', self.dataset_id)[0]:
+            echo("Dataset {} already exists".format(self.dataset_id))
+            return
+        # Construct a full Dataset object to send to the API.
+        dataset = bigquery.Dataset(self.dataset_id)
+
+        # TODO(developer): Specify the geographic location where the dataset should reside.
+        dataset.location = location
+        assert type(location)==str, 'location must be a string'
+
+        # Send the dataset to the API for creation, with an explicit timeout.
+        # Raises google.api_core.exceptions.Conflict if the Dataset already
+        # exists within the project.
+        dataset = self.client.create_dataset(dataset, exists_ok)  # Make an API request.
+        self.cache.put('dataset', self.dataset_id, dataset)
+        echo("Created dataset {}.{}".format(self.client.project, dataset.dataset_id))
+
+    def set_expiracy(self, num_days:int):
+        '''
+        Set expiracy of the refered BigQuery directory(dataset) object 
+        
+                Parameters:
+                        num_days (int): default table expiration delay (days) at the dataset level for any of the created tables
+                            ignored when defined at the table level
+                        
+        '''
+        # dataset_id = 'your-project.your_dataset'
+        # a fresh dataset, update_dataset sends its etag and the cached copy may be outdated
+        dataset = self.client.get_dataset(self.dataset_id)  # Make an API request.
+        dataset.default_table_expiration_ms = num_days * 24 * 3600 * 1000  # In milliseconds.
+
+        dataset = self.client.update_dataset(
+            dataset, ["default_table_expiration_ms"]
+        )  # Make an API request.
+        self.cache.put('dataset', self.dataset_id, dataset)
+
+        full_dataset_id = "{}.{}".format(dataset.project, dataset.dataset_id)
+        echo(
+            "Updated dataset {} with new expiration {} ms".format(
+                full_dataset_id, dataset.default_table_expiration_ms
+            )
+        )
+
+        
+        
+class Table():
+    '''
+    Creates BigQuery table path from a directory
+            Parameters:
+                    directory (object): directory
+                    table (str): Name of the table
+    '''
+    
+    def __init__(self, client, directory, table):
+        self.project = directory.project
+        self.dataset = directory.dataset
+        self.table = table
+        self.client = instrument(client)
+        self.cache = getattr(directory, 'cache', None) or MetadataCache.shared(client)
+        
+    def path(self, language, display=False, table_suffix=""):
+        '''
+        Returns the full path of a BigQuert directory object 
+        
+                Parameters:
+                        language (str): legacy or standard
+                        display* (boolean): prints the directory once the function is completez
+                        table_suffix* (str): string to be added at the end of the table path, separator is already handled by the function           
+        '''
+        #checks
+        if len(table_suffix)> 0 :#if there is a table suffix, adds a separator
+            if table_suffix == "_":
+                table_suffix = "_"
+            else:
+                table_suffix = "_" + str(table_suffix)
+        if language == "standard":
+            self.dir = "`{project}.{dataset}.{table}{suffix}`".format(project = self.project, dataset = self.dataset, table = self.table, suffix = table_suffix)              
+        elif language == "legacy":
+            self.dir = "{project}:{dataset}.{table}{suffix}".format(project = self.project, dataset = self.dataset, table = self.table, suffix = table_suffix)
+        elif language == "directory":
+            self.dir = "{project}.{dataset}.{table}{suffix}".format(project = self.project, dataset = self.dataset, table = self.table, suffix = table_suffix)
+        if display:
+            echo("> directory = {}".format((self.dir)))
+        return(self.dir)
+    
+    def check_if_exist(self):
+        
+        if self.cache.table_exists(self.path("directory")):  # Make an API request if not cached.
+            echo("Table {} already exists.".format(self.path("directory")))
+            return(True)
+        echo("Table {} is not found.".format(self.path("directory")))
+        return(False)
+        
+    def set_expiracy(self, num_days:int):
+        '''
+        Set expiracy of the refered BigQuery talbe object 
+        
+                Parameters:
+                        num_days (int): numbers of day to maintain the table (from now)
+                        
+        '''
+
+        # a fresh table, update_table sends its etag and the cached copy may be outdated
+        table = self.client.get_table(self.path("directory"))  # API request
+
+        assert table.expires is None
+
+        # set table to expire 5 days from now
+        expiration = datetime.now(datetime.timezone.utc) + timedelta(days=num_days)
+        table.expires = expiration
+        table = self.client.update_table(table, ["expires"])  # API request
+        self.cache.put('table', self.path("directory"), table)
+
+        # expiration is stored in milliseconds
+        margin = datetime.timedelta(microseconds=1000)
+        assert expiration - margin <= table.expires <= expiration + margin
+
+    def to_storage(self, bucket_name: str, csv_file_name:str, location = "EU"):
+        '''
+        Send a copy of the BQ table as .csv file to a storage bucket located on the same project
+        
+                Parameters:
+                        bucket_name (str): name of the GCS bucket (includes subfloder if required)
+                        csv_file_name (str): name of the endpoint file
+                        
+        '''
+
+        destination_uri = "gs://{}/{}".format(bucket_name, csv_file_name)
+        dataset_ref = bigquery.DatasetReference(self.project, self.dataset)
+        table_ref = dataset_ref.table(self.table)
+
+        extract_job = self.client.extract_table(
+            table_ref,
+            destination_uri,
+            # Location must match that of the source table.
+            location=location,
+        )  # API request
+        with registry.call('bigquery', 'extract'):
+            extract_job.result()  # Waits for job to complete.
+
+        echo(
+            "Exported {}:{}.{} to {}".format(self.project, self.dataset, self.table, destination_uri)
+        )
+
+    def to_storage_sharded(self, bucket_name: str, prefix: str, file_format: str = "PARQUET", compression: str = "SNAPPY",
+                           location = "EU", local_dir: str = None, workers: int = 8, storage_client = None):
+        '''
+        Exports the BQ table as compressed shards through a wildcard URI, required for tables over 1 GB,
+        and optionally downloads them in parallel as a local Arrow dataset
+        
+                Parameters:
+                        bucket_name (str): name of the GCS bucket
+                        prefix (str): parent folder of the exports in the bucket, ex: exports/runner_logs,
+                                      each export writes its shards to a new {prefix}/{timestamp}-{id} folder
+                        file_format* (str): PARQUET or AVRO
+                        compression* (str): SNAPPY, GZIP or ZSTD for PARQUET, SNAPPY or DEFLATE for AVRO
+                        location* (str): location of the source table
+                        local_dir* (str): if set, the shards are downloaded to this folder
+                        workers* (int): number of parallel downloads
+                        storage_client* (storage.Client): defaults to a client on the bigquery client project
+
+                Returns:
+                        report (dict): uri, folder, shards, bytes, files (local paths) and dataset
+                                       (pyarrow.dataset.Dataset of the local parquet shards, read lazily)
+        '''
+        file_format = file_format.upper()
+        assert file_format in ("PARQUET", "AVRO"), 'file_format must be PARQUET or AVRO'
+        # a folder per export, shards of an earlier export to the same prefix are never picked up
+        folder = f"{prefix.strip('/')}/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        extension = file_format.lower()
+        destination_uri = f"gs://{bucket_name}/{folder}/{self.table}-*.{extension}"
+        dataset_ref = bigquery.DatasetReference(self.project, self.dataset)
+        table_ref = dataset_ref.table(self.table)
+
+        job_config = bigquery.ExtractJobConfig(destination_format=file_format, compression=compression.upper())
+        extract_job = self.client.extract_table(
+            table_ref,
+            destination_uri,
+            job_config=job_config,
+            # Location must match that of the source table.
+            location=location,
+        )  # API request
+        with registry.call('bigquery', 'extract'):
+            extract_job.result()  # Waits for job to complete.
+
+        bucket = Bucket(storage_client or new_storage_client(self.client.project), bucket_name)
+        shards = list(bucket.iter_files(prefix=f"{folder}/", pattern=f"{folder}/{self.table}-*.{extension}"))
+        # the job counts the files it wrote, one count per destination uri
+        file_counts = extract_job.destination_uri_file_counts
+        if file_counts and file_counts[0] != len(shards):
+            raise RuntimeError(f"{destination_uri} holds {len(shards)} shards, the export wrote {file_counts[0]}")
+        report = {
+            'uri': destination_uri,
+            'folder': folder,
+            'shards': file_counts[0] if file_counts else len(shards),
+            'bytes': sum(shard['size'] for shard in shards),
+            'files': [],
+            'dataset': None,
+        }
+        echo(
+            "Exported {}:{}.{} to {} ({} shards, {:.1f} MB)".format(
+                self.project, self.dataset, self.table, destination_uri, report['shards'], report['bytes'] / 2**20
+            )
+        )
+
+        if local_dir is not None:
+            files = {shard['name']: os.path.join(local_dir, os.path.basename(shard['name'])) for shard in shards}
+            transfer = bucket.download_many(files, workers=workers)
+            if transfer['failures']:
+                raise RuntimeError(f"{len(transfer['failures'])} shards of {destination_uri} failed to download")
+            report['files'] = sorted(files.values())
+            if file_format == "PARQUET":
+                import pyarrow.dataset as ds
+                from pyarrow import fs
+
+                # the shards are memory-mapped and read on demand, ex: report['dataset'].to_table(columns=[...])
+                report['dataset'] = ds.dataset(report['files'], format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+        return(report)
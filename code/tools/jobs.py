@@ -0,0 +1,159 @@
+'''
+Tracking of concurrent BigQuery jobs
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import asyncio
+import threading
+from time import sleep
+from concurrent.futures import Future, wait as wait_futures
+
+from google.api_core.exceptions import BadRequest
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+
+
+#-------------------------------
+#          Jobs
+#-------------------------------
+
+class JobTracker:
+    '''
+    Tracks many BigQuery query and load jobs together from a background thread
+            Parameters:
+                    client (object): bigquery client
+                    min_interval* (float): first delay (s) between two polls
+                    max_interval* (float): longest delay (s) between two polls
+                    backoff* (float): the delay is multiplied by backoff after every poll where no job finished
+                    list_threshold* (int): above this number of pending jobs, a poll is a single list_jobs sweep
+                        instead of one get_job per job
+    '''
+    def __init__(self, client, min_interval=0.5, max_interval=10, backoff=1.5, list_threshold=5):
+        self.client = instrument(client)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.list_threshold = list_threshold
+        self.jobs = {}
+        self.futures = {}
+        self.labels = {}
+        self.pending = set()
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, job, label=None):
+        '''
+        Tracks a job and returns a concurrent.futures.Future resolved with the job once it is DONE
+
+                Parameters:
+                        job (object): bigquery QueryJob or LoadJob
+                        label* (str): name of the job in the report, defaults to the job id
+        '''
+        future = Future()
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self.futures[job.job_id] = future
+            self.labels[job.job_id] = label or job.job_id
+            self.pending.add(job.job_id)
+            # the polling thread clears _thread under the lock before it exits
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return(future)
+
+    def awaitable(self, job):
+        '''
+        Returns an asyncio awaitable of a tracked job
+        '''
+        return(asyncio.wrap_future(self.futures[job.job_id]))
+
+    def _resolve(self, job_id):
+        job = self.jobs[job_id]
+        with registry.call('bigquery', 'job.reload'):
+            job.reload()  # Make an API request.
+        registry.record_job(job)
+        with self._lock:
+            self.pending.discard(job_id)
+        if job.error_result:
+            self.futures[job_id].set_exception(BadRequest(job.error_result.get('message', 'job failed'), errors=job.errors))
+        else:
+            self.futures[job_id].set_result(job)
+
+    def poll(self):
+        '''
+        Updates every pending job once, returns the number of jobs that finished
+        '''
+        with self._lock:
+            pending = list(self.pending)
+        if not pending:
+            return(0)
+        self.polls += 1
+        finished = []
+        if len(pending) > self.list_threshold:
+            # a single paginated sweep over the recent jobs of the project
+            created = [self.jobs[job_id].created for job_id in pending if self.jobs[job_id].created]
+            for job in self.client.list_jobs(min_creation_time=min(created) if created else None):
+                if job.job_id in pending and job.state == 'DONE':
+                    finished.append(job.job_id)
+        else:
+            for job_id in pending:
+                job = self.jobs[job_id]
+                with registry.call('bigquery', 'job.reload'):
+                    job.reload()  # Make an API request.
+                if job.state == 'DONE':
+                    finished.append(job_id)
+        for job_id in finished:
+            self._resolve(job_id)
+        return(len(finished))
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._lock:
+                if not self.pending:
+                    self._thread = None
+                    return
+            try:
+                finished = self.poll()
+            except Exception as e:
+                echo(Fore.RED + f"> Job polling failed: {e}" + Style.RESET_ALL)
+                finished = 0
+            interval = self.min_interval if finished else min(self.max_interval, interval * self.backoff)
+            sleep(interval)
+
+    def wait(self, timeout=None):
+        '''
+        Blocks until every tracked job is DONE, then returns the report
+        '''
+        wait_futures(list(self.futures.values()), timeout=timeout)
+        return(self.report())
+
+    def report(self):
+        '''
+        Aggregate state of the tracked jobs
+        '''
+        states, errors, bytes_billed = {}, {}, 0
+        for job_id, job in self.jobs.items():
+            state = 'PENDING/RUNNING' if job_id in self.pending else ('FAILED' if job.error_result else 'DONE')
+            states[state] = states.get(state, 0) + 1
+            if job.error_result:
+                errors[self.labels[job_id]] = job.error_result.get('message')
+            if job_id not in self.pending:
+                bytes_billed += getattr(job, 'total_bytes_billed', None) or 0
+        return({'jobs': len(self.jobs), 'states': states, 'total_bytes_billed': bytes_billed,
+                'errors': errors, 'polls': self.polls})
+
+    def display(self):
+        report = self.report()
+        echo(Fore.MAGENTA + f"> Jobs: {report['jobs']} {report['states']}")
+        echo(f"> Billed Bytes: {report['total_bytes_billed']}")
+        echo(f"> Polls: {report['polls']}")
+        for label, message in report['errors'].items():
+            echo(Fore.RED + f"> {label} FAILED (ಠ_ಠ)")
+            echo('ERROR: {}'.format(message))
+        echo(Style.RESET_ALL)
@@ -0,0 +1,174 @@
+'''
+Dataset and table metadata cache shared by the tools
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import threading
+from datetime import datetime, timedelta
+
+from google.cloud.exceptions import NotFound
+from instrumentation import instrument
+
+
+#-------------------------------
+#        metadata cache
+#-------------------------------
+
+class MetadataCache:
+    '''
+    Dataset and table metadata shared by the tools using the same client, kept for ttl seconds
+    Not found datasets and tables are kept for negative_ttl seconds, and our own writes invalidate their table.
+            Parameters:
+                    client (object): bigquery client
+                    ttl* (float): lifetime (s) of a dataset or table
+                    negative_ttl* (float): lifetime (s) of a not found dataset or table
+    '''
+    def __init__(self, client, ttl:float = 300, negative_ttl:float = 30):
+        self.client = instrument(client)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.listings = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls, client):
+        '''
+        Cache of a client, created on first use
+        '''
+        client = instrument(client)
+        # kept on the instrumented client, dropped with it
+        cache = client.__dict__.get('_metadata_cache')
+        if cache is None:
+            cache = client._metadata_cache = cls(client)
+        return(cache)
+
+    def _put(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self.lock:
+            self.entries[key] = (datetime.now() + timedelta(seconds=ttl), value)
+        return(value)
+
+    def peek(self, kind:str, object_id:str):
+        '''
+        Cached (found, value) of a dataset or table without any API request, found is None if unknown or expired
+        '''
+        with self.lock:
+            entry = self.entries.get((kind, object_id))
+        if entry is None or entry[0] < datetime.now():
+            return(None, None)
+        return(entry[1] is not None, entry[1])
+
+    def _get(self, kind:str, object_id:str, fetch):
+        found, value = self.peek(kind, object_id)
+        if found is not None:
+            self.hits += 1
+            return(value)
+        self.misses += 1
+        try:
+            value = fetch(object_id)  # Make an API request.
+        except NotFound:
+            value = None
+        return(self._put((kind, object_id), value))
+
+    def get_dataset(self, dataset_id:str):
+        '''
+        Dataset project.dataset, None if not found
+        '''
+        return(self._get('dataset', dataset_id, self.client.get_dataset))
+
+    def _listed(self, table_id:str):
+        # True or False if the dataset of the table was listed by prefetch less than ttl ago, else None
+        dataset_id = table_id.rsplit('.', 1)[0]
+        with self.lock:
+            listing = self.listings.get(dataset_id)
+        if listing is None or listing[0] < datetime.now():
+            return(None)
+        return(table_id in listing[1])
+
+    def get_table(self, table_id:str):
+        '''
+        Table project.dataset.table, None if not found
+        '''
+        if self.peek('dataset', table_id.rsplit('.', 1)[0])[0] is False or self._listed(table_id) is False:
+            # the dataset is missing, or was listed without the table
+            self.hits += 1
+            return(None)
+        return(self._get('table', table_id, self.client.get_table))
+
+    def dataset_exists(self, dataset_id:str):
+        with self.lock:
+            listing = self.listings.get(dataset_id)
+        if listing is not None and listing[0] >= datetime.now():
+            self.hits += 1
+            return(True)
+        return(self.get_dataset(dataset_id) is not None)
+
+    def table_exists(self, table_id:str):
+        found = self.peek('table', table_id)[0]
+        if found is None:
+            found = self._listed(table_id)
+        if found is not None:
+            self.hits += 1
+            return(found)
+        return(self.get_table(table_id) is not None)
+
+    def schema(self, table_id:str):
+        table = self.get_table(table_id)
+        return(None if table is None else table.schema)
+
+    def num_rows(self, table_id:str):
+        table = self.get_table(table_id)
+        return(None if table is None else table.num_rows)
+
+    def put(self, kind:str, object_id:str, value):
+        '''
+        Stores the dataset or table returned by one of our own create or update calls
+        '''
+        return(self._put((kind, object_id), value))
+
+    def invalidate(self, object_id:str = None):
+        '''
+        Drops a dataset or a table (partition decorators are ignored) after a write, or every entry if object_id is None
+        '''
+        with self.lock:
+            if object_id is None:
+                self.entries.clear()
+                self.listings.clear()
+                return
+            object_id = object_id.split('$')[0]
+            for kind in ('dataset', 'table'):
+                self.entries.pop((kind, object_id), None)
+            # a write may have created the table, the listing of its dataset is outdated
+            self.listings.pop(object_id, None)
+            self.listings.pop(object_id.rsplit('.', 1)[0], None)
+
+    def prefetch(self, dataset_id:str):
+        '''
+        Lists a whole dataset in one call, the existence of its tables is then answered without API request
+        for ttl seconds. Schemas and row counts are still fetched on first use.
+
+                Returns:
+                        table_ids (list[str])
+        '''
+        try:
+            tables = self.client.list_tables(dataset_id)  # Make an API request.
+            table_ids = [f"{dataset_id}.{table.table_id}" for table in tables]
+        except NotFound:
+            self._put(('dataset', dataset_id), None)
+            return([])
+        with self.lock:
+            self.listings[dataset_id] = (datetime.now() + timedelta(seconds=self.ttl), set(table_ids))
+            for key in [key for key, entry in self.entries.items() if key[0] == 'table' and entry[1] is not None]:
+                # tables cached as existing that are no longer listed
+                if key[1].rsplit('.', 1)[0] == dataset_id and key[1] not in table_ids:
+                    del self.entries[key]
+        return(table_ids)
+
+    def stats(self):
+        return({'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)})
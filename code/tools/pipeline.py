@@ -0,0 +1,191 @@
+'''
+Dependency-aware execution of Query.to_table steps
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import re
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, wait as wait_futures
+
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+from .jobs import JobTracker
+from .query import Query
+
+
+#-------------------------------
+#          Pipeline
+#-------------------------------
+
+class Pipeline:
+    '''
+    Runs Query.to_table steps concurrently in dependency order
+            Parameters:
+                    client (object): bigquery client
+                    max_jobs* (int): max number of steps running at the same time
+    '''
+    def __init__(self, client, max_jobs=8):
+        self.client = instrument(client)
+        self.max_jobs = max_jobs
+        self.steps = {}
+
+    def add(self, name:str, query:str, endpoint, depends_on:list = None, **to_table_kwargs):
+        '''
+        Adds a step writing the results of a query to a table
+        
+                Parameters:
+                        name (str): name of the step
+                        query (str): SQL of the step
+                        endpoint (obj:Table): output table
+                        depends_on* (list[str]): names of the upstream steps, inferred from the tables read by the query if None
+                        to_table_kwargs: other parameters of Query.to_table, ex: table_suffix, write_disposition
+                            (sequence and tracker are set by the pipeline)
+        '''
+        reserved = {'sequence', 'tracker'} & set(to_table_kwargs)
+        if reserved:
+            raise ValueError(f"Step {name}: {', '.join(sorted(reserved))} can't be passed, the pipeline sets them")
+        table_suffix = to_table_kwargs.get('table_suffix', '')
+        if len(table_suffix) > 0 and '$' not in table_suffix:
+            table_suffix = "_" + str(table_suffix)
+        self.steps[name] = {
+            'query': query,
+            'endpoint': endpoint,
+            'destination': f"{endpoint.project}.{endpoint.dataset}.{endpoint.table}{table_suffix}".split('$')[0],
+            'depends_on': depends_on,
+            'kwargs': to_table_kwargs,
+        }
+        return(self)
+
+    def dependencies(self):
+        '''
+        Returns step name -> names of the upstream steps
+        '''
+        dependencies = {}
+        for name, step in self.steps.items():
+            if step['depends_on'] is not None:
+                dependencies[name] = list(step['depends_on'])
+                continue
+            query = step['query'].replace('`', '').lower()
+            dependencies[name] = []
+            for other, upstream in self.steps.items():
+                if other == name:
+                    continue
+                project, dataset, table = upstream['destination'].lower().split('.')
+                pattern = r'(?<![\w.-])({}\.)?{}\.{}(?!\w)'.format(re.escape(project), re.escape(dataset), re.escape(table))
+                if re.search(pattern, query):
+                    dependencies[name].append(other)
+        return(dependencies)
+
+    def _order(self, dependencies):
+        # topological order, raises on unknown steps and cycles
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name not in self.steps:
+                raise ValueError(f"Unknown pipeline step {name}")
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline cycle through step {name}")
+            visiting.add(name)
+            for upstream in dependencies[name]:
+                visit(upstream)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.steps:
+            visit(name)
+        return(order)
+
+    @registry.traced('pipeline.run')
+    def run(self):
+        '''
+        Runs every ready step concurrently up to max_jobs, the steps downstream of a failure are skipped
+
+                Returns:
+                        report (dict): state and timings of each step, critical path and wall time
+        '''
+        dependencies = self.dependencies()
+        order = self._order(dependencies)
+        tracker = JobTracker(self.client)
+        state = {name: 'waiting' for name in order}
+        timings = {name: {'start': None, 'end': None} for name in order}
+        running = {}
+        # utc, the timings of the finished steps are the started and ended times of their jobs
+        started = datetime.now(timezone.utc)
+
+        while True:
+            for name in order:
+                if state[name] != 'waiting':
+                    continue
+                upstream = [state[u] for u in dependencies[name]]
+                if any(s in ('failed', 'skipped') for s in upstream):
+                    state[name] = 'skipped'
+                    echo(Fore.RED + f"> Step {name} skipped, an upstream step failed" + Style.RESET_ALL)
+                elif all(s == 'done' for s in upstream) and len(running) < self.max_jobs:
+                    step = self.steps[name]
+                    state[name] = 'running'
+                    timings[name]['start'] = datetime.now(timezone.utc)
+                    try:
+                        query_job = Query(self.client, step['query']).to_table(
+                            step['endpoint'], sequence=False, tracker=tracker, **step['kwargs'])
+                        running[tracker.futures[query_job.job_id]] = (name, query_job)
+                    except Exception as e:
+                        state[name] = 'failed'
+                        timings[name]['end'] = datetime.now(timezone.utc)
+                        echo(Fore.RED + f"> Step {name} FAILED (ಠ_ಠ)\nERROR: {e}" + Style.RESET_ALL)
+            if not running:
+                break
+            finished, _ = wait_futures(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, query_job = running.pop(future)
+                timings[name]['end'] = datetime.now(timezone.utc)
+                # the tracker notices the end up to one backoff interval late, the job knows when it ran
+                if getattr(query_job, 'started', None) and getattr(query_job, 'ended', None):
+                    timings[name] = {'start': query_job.started, 'end': query_job.ended}
+                if future.exception() is None:
+                    state[name] = 'done'
+                    echo(Fore.GREEN + f"> Step {name} DONE (ಠ‿↼)" + Style.RESET_ALL)
+                else:
+                    state[name] = 'failed'
+                    echo(Fore.RED + f"> Step {name} FAILED (ಠ_ಠ)\nERROR: {future.exception()}" + Style.RESET_ALL)
+
+        return(self._report(order, dependencies, state, timings, started, tracker))
+
+    def _report(self, order, dependencies, state, timings, started, tracker):
+        durations = {}
+        for name in order:
+            start, end = timings[name]['start'], timings[name]['end']
+            durations[name] = (end - start).total_seconds() if start and end else 0.0
+
+        # longest path through the DAG, weighted by the step durations
+        path_time, previous = {}, {}
+        for name in order:
+            upstream = max(dependencies[name], key=lambda u: path_time[u], default=None)
+            path_time[name] = durations[name] + (path_time[upstream] if upstream else 0.0)
+            previous[name] = upstream
+        critical_path = []
+        name = max(order, key=lambda n: path_time[n], default=None)
+        while name is not None:
+            critical_path.insert(0, name)
+            name = previous[name]
+
+        report = {
+            'steps': {name: {'state': state[name], 'depends_on': dependencies[name], 'duration_s': round(durations[name], 3),
+                             'start_s': round((timings[name]['start'] - started).total_seconds(), 3) if timings[name]['start'] else None}
+                      for name in order},
+            'critical_path': critical_path,
+            'critical_path_s': round(sum(durations[n] for n in critical_path), 3),
+            'sum_of_steps_s': round(sum(durations.values()), 3),
+            'wall_time_s': round((datetime.now(timezone.utc) - started).total_seconds(), 3),
+            'total_bytes_billed': tracker.report()['total_bytes_billed'],
+        }
+        echo(Fore.MAGENTA + f"> Critical path: {' -> '.join(critical_path)} ({report['critical_path_s']}s)")
+        echo(f"> Wall time: {report['wall_time_s']}s, sum of the steps: {report['sum_of_steps_s']}s")
+        echo(Style.RESET_ALL)
+        return(report)
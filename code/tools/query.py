@@ -0,0 +1,595 @@
+'''
+BigQuery queries, their local result cache and parameterized fan-out
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+from .metadata import MetadataCache
+
+
+#-------------------------------
+#          Query cache
+#-------------------------------
+
+class QueryCache:
+    '''
+    Local cache of query results stored as parquet files
+    An entry is keyed on the normalised SQL and the last modification time of every table it reads,
+    so it is only reused while its inputs are unchanged. The tables read by a query come from one dry run
+    per SQL, and their modification times from the shared MetadataCache, so changes made by other clients
+    are only seen once its ttl has expired.
+            Parameters:
+                    client (object): bigquery client
+                    directory (str): folder of the cached results
+                    max_bytes* (int): size of the cache, the least recently used results are evicted beyond it
+    '''
+    # functions returning a different result at each run
+    volatile = re.compile(r'\b(current_date|current_datetime|current_time|current_timestamp|rand|generate_uuid|session_user)\s*\(', re.I)
+
+    def __init__(self, client, directory:str, max_bytes:int = 10 * 1024**3):
+        self.client = instrument(client)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        # normalised SQL -> ids of the tables it reads
+        self.referenced = {}
+        os.makedirs(directory, exist_ok=True)
+
+    # string literals are kept as is, comments and whitespace runs are normalised
+    tokens = re.compile(r'(\'(?:[^\'\\]|\\.)*\'|"(?:[^"\\]|\\.)*"|`[^`]*`)|((?:--[^\n]*|#[^\n]*|/\*.*?\*/|\s)+)', re.S)
+
+    @classmethod
+    def normalise(cls, query:str):
+        '''
+        Removes the comments and the layout of a query
+        '''
+        query = cls.tokens.sub(lambda match: match.group(1) or ' ', query)
+        return(query.strip().rstrip(';').strip())
+
+    def key(self, query:str):
+        '''
+        Returns the cache key of a query, None if its result can't be cached
+        '''
+        normalised = self.normalise(query)
+        if self.volatile.search(normalised):
+            return(None)
+        if normalised not in self.referenced:
+            # a dry run is free and lists the tables read by the query
+            dry_run = self.client.query(query, job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False))  # Make an API request.
+            self.referenced[normalised] = sorted(str(reference) for reference in dry_run.referenced_tables or [])
+        metadata = MetadataCache.shared(self.client)
+        versions = []
+        for table_id in self.referenced[normalised]:
+            table = metadata.get_table(table_id)
+            if table is None or table.streaming_buffer is not None:
+                return(None)
+            versions.append(f"{table_id}@{table.modified.isoformat()}")
+        query_hash = hashlib.sha256(normalised.encode()).hexdigest()[:32]
+        state_hash = hashlib.sha256('|'.join(versions).encode()).hexdigest()[:32]
+        return(f"{query_hash}-{state_hash}")
+
+    def _path(self, key, extension):
+        return(os.path.join(self.directory, f"{key}.{extension}"))
+
+    def get(self, key):
+        '''
+        Returns the cached dataframe of a key, None on a miss
+        '''
+        # an entry is complete once put has written its metadata
+        if key is None or not all(os.path.exists(self._path(key, extension)) for extension in ('parquet', 'json')):
+            self.misses += 1
+            return(None)
+        import pandas as pd
+
+        os.utime(self._path(key, 'parquet'))  # marks the entry as recently used
+        with open(self._path(key, 'json')) as file:
+            metadata = json.load(file)
+        self.hits += 1
+        self.bytes_saved += metadata.get('total_bytes_billed') or 0
+        return(pd.read_parquet(self._path(key, 'parquet')))
+
+    def put(self, key, dataframe, query_job=None):
+        if key is None:
+            return
+        dataframe.to_parquet(self._path(key, 'parquet'))
+        with open(self._path(key, 'json'), 'w') as file:
+            json.dump({'total_bytes_billed': getattr(query_job, 'total_bytes_billed', None),
+                       'created': datetime.now().isoformat()}, file)
+        self.evict()
+
+    def size(self):
+        return(sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)))
+
+    def evict(self):
+        '''
+        Removes the least recently used results until the cache fits in max_bytes
+        '''
+        entries = sorted(
+            (os.path.getmtime(os.path.join(self.directory, name)), name[:-len('.parquet')])
+            for name in os.listdir(self.directory) if name.endswith('.parquet'))
+        total = self.size()
+        for _, key in entries:
+            if total <= self.max_bytes:
+                break
+            for extension in ('parquet', 'json'):
+                if os.path.exists(self._path(key, extension)):
+                    total -= os.path.getsize(self._path(key, extension))
+                    os.remove(self._path(key, extension))
+
+    def invalidate(self, query:str = None):
+        '''
+        Removes the cached results of a query, or the whole cache if query is None
+        '''
+        if query is None:
+            self.referenced.clear()
+        else:
+            self.referenced.pop(self.normalise(query), None)
+        prefix = hashlib.sha256(self.normalise(query).encode()).hexdigest()[:32] if query else ''
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return({'hits': self.hits, 'misses': self.misses, 'bytes_saved': self.bytes_saved, 'size_bytes': self.size()})
+
+#-------------------------------
+#          Query
+#-------------------------------   
+
+class Query:
+    '''
+    BigQuery query
+            Parameters:
+                    query (str): SQL of the query
+                    cache* (QueryCache): if set, to_df reuses the results of the unchanged queries
+    '''
+    
+    def __init__(self, client, query:str, cache=None):
+        self.client = instrument(client)
+        self.query = query
+        self.cache = cache
+        
+    def _check_query_job_state(self, query_job):
+        # Check on the progress by getting the job's updated state. Once the state
+        # is `DONE`, the results are ready.
+        query_job = self.client.get_job(
+            query_job.job_id, location=query_job.location
+        )  # Make an API request.
+        echo(f"> Job {query_job.job_id} is currently {query_job.state} ", end='')
+        while query_job.state in ['RUNNING', 'PENDING']:
+            echo(">", end='')
+            query_job = self.client.get_job(
+                query_job.job_id, location=query_job.location
+                )  
+            sleep(0.5)
+        
+        try:
+            query_job.result()
+            echo(Fore.GREEN + f"\n> Query {query_job.state} (ಠ‿↼)") 
+        except BadRequest as e:
+            for e in query_job.errors:
+                echo(Fore.RED + f"\n> Query FAILED (ಠ_ಠ)")
+                echo('ERROR: {}'.format(e['message']))
+        echo(Style.RESET_ALL)
+        return(query_job)
+        
+    def _retrieve_query_job_metadata(self, query_job):
+        try:
+            if query_job is not None:
+                echo(Fore.MAGENTA + f"> Email: {query_job.user_email}")
+                echo(f"> Job time: {query_job.created}")
+                echo(f"> Billed Bytes: {query_job.total_bytes_billed}")
+            else:
+                echo(Fore.MAGENTA + f"> Result read from the local cache, 0 bytes billed")
+            if self.cache is not None:
+                stats = self.cache.stats()
+                echo(f"> Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes_saved']} bytes saved")
+            echo(Style.RESET_ALL)
+        except:
+            echo(Fore.RED + f"> Error printing metadata")
+            echo(Style.RESET_ALL)
+
+    
+    def display(self):
+        '''
+        Returns a beautyfied and readable version of the query
+                        
+        '''
+        from pygments import highlight, lexers, formatters
+
+        lexer = lexers.MySqlLexer()
+        return(print(highlight(self.query, lexer, formatters.TerminalFormatter())))
+            
+                
+    def execute(self, dry_run=False, sequence=True, tracker=None):
+        '''
+        Executes the query
+        
+            Parameters:
+                dry_run: (bool) if set to True, runs an estimation of the costs
+                tracker: (JobTracker) if set and sequence is False, the job is tracked instead of awaited
+                        
+        '''        
+        # Set up query job configs
+        job_config = bigquery.QueryJobConfig(dry_run=dry_run, use_query_cache=False)
+        
+        query_job=self.client.query(
+            self.query,
+            job_config=job_config
+        )
+        
+        if dry_run:
+            # A dry run query completes immediately.
+            echo(f"> This query will process {query_job.total_bytes_processed} bytes.")
+        
+        if sequence and not dry_run:
+            self._check_query_job_state(query_job)
+            self._retrieve_query_job_metadata(query_job)
+        elif tracker is not None and not dry_run:
+            tracker.add(query_job)
+        return(query_job)
+            
+        
+        
+    
+    def to_table(
+        self, 
+        endpoint, 
+        table_suffix: str="", 
+        write_disposition: str="WRITE_TRUNCATE", 
+        date_partitioning_field : str = None, 
+        clustering_fields: list = None, 
+        sequence: bool = True,
+        dry_run: bool = False,
+        tracker = None
+        ):
+        """
+        Creates a new table from the results of a query
+        
+            Parameters:
+                endpoint (obj:Table): output table path
+                table_suffix (str): any variable suffix to add at the end of the table ("_" will be added automatically)
+                write_disposition (str): default is WRITE_TRUNCATE and will replace the table, can be changed for WRITE_APPEND
+                date_partitioning_field (str): 	If set, the table is partitioned by this field, the field must be a top-level TIMESTAMP, DATETIME, or DATE field
+                clustering_fields (list[str]): Fields defining clustering for the table,  immutable after table creation
+                sequence (bool): if set to False, doesn't wait for the execution of the job to start the next one in the loop (beta)         
+                dry_run (bool): True if this query should be a dry run to estimate costs
+                tracker (JobTracker): if set and sequence is False, the job is tracked instead of awaited
+                        
+        """
+        
+        if not sequence and tracker is None:
+            echo(Fore.RED + f"\n> Sequencing is deactivated, job status wont be verified" + Style.RESET_ALL) 
+        #if there is a table suffix, a sperator must be added
+        if len(table_suffix) > 0 and '$' not in table_suffix :
+            table_suffix = "_" + str(table_suffix)
+        # Prepare a reference to a new dataset for storing the query results.   
+        job_config = bigquery.QueryJobConfig()
+        job_config.destination = f"{endpoint.project}.{endpoint.dataset}.{endpoint.table}{table_suffix}"
+        job_config.write_disposition = write_disposition
+        #work in progress
+        job_config.clustering_fields = clustering_fields
+        if date_partitioning_field:
+            job_config.time_partitioning = bigquery.table.TimePartitioning(
+                # Default partitioning type is day
+                field = date_partitioning_field
+            )
+        job_config.dry_run = dry_run
+        query = self.query
+        # Run the query.
+        echo(f'> Exporting query results to table {job_config.destination}')
+        query_job = self.client.query(query, job_config=job_config)
+        if not dry_run:
+            MetadataCache.shared(self.client).invalidate(f"{endpoint.project}.{endpoint.dataset}.{endpoint.table}{table_suffix}")
+        
+        if sequence:
+            query_job = self.client.get_job(
+                query_job.job_id, location=query_job.location
+            )  # Make an API request.
+
+            # Update the query job once done
+            query_job = self._check_query_job_state(query_job)
+            self._retrieve_query_job_metadata(query_job)
+            return(query_job)
+        if tracker is not None and not dry_run:
+            tracker.add(query_job, label=job_config.destination)
+        return(query_job)
+
+        
+    
+    def to_df(self):
+        '''
+        Transfers the results of the query to a dataframe using a storage bucket as intermediary storage
+        Strongly recommended
+        
+                Parameters:
+                        sequence: (bool) if set to True, wait for the execution of the job            
+        ''' 
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(self.query)
+            dataframe = self.cache.get(key)
+            if dataframe is not None:
+                self._retrieve_query_job_metadata(None)
+                return(dataframe)
+
+        query_job = self.client.query(self.query)
+        dataframe = (
+            query_job
+            .result()
+            .to_dataframe(
+                progress_bar_type='tqdm'
+            )
+        )
+        registry.record_job(query_job)
+        
+        if self.cache is not None:
+            self.cache.put(key, dataframe, query_job)
+            self._retrieve_query_job_metadata(query_job)
+        return(dataframe)
+
+    def _bqstorage_client(self):
+        # the Storage Read API is optional, the REST API is used when it isn't installed
+        try:
+            from google.cloud import bigquery_storage
+        except ImportError:
+            return(None)
+        return(bigquery_storage.BigQueryReadClient())
+
+    def _read_streams(self, query_job, bqstorage_client, parallel_streams, max_queue_size):
+        # reads the destination table of the query with parallel_streams Storage API streams,
+        # the bounded queue keeps at most max_queue_size pages in memory
+        from google.cloud.bigquery_storage import types
+
+        table = query_job.destination
+        session = bqstorage_client.create_read_session(
+            parent=f"projects/{self.client.project}",
+            read_session=types.ReadSession(
+                table=f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}",
+                data_format=types.DataFormat.ARROW,
+            ),
+            max_stream_count=parallel_streams,
+        )  # Make an API request.
+        pages = queue.Queue(maxsize=max_queue_size)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # gives up once the consumer stopped reading, returns False so the reader stops downloading
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return(True)
+                except queue.Full:
+                    continue
+            return(False)
+
+        def read(stream):
+            try:
+                for page in bqstorage_client.read_rows(stream.name).rows(session).pages:
+                    if stop.is_set() or not put(page.to_arrow()):
+                        break
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        streams = session.streams
+        with ThreadPoolExecutor(max_workers=max(1, len(streams))) as executor:
+            for stream in streams:
+                executor.submit(read, stream)
+            remaining = len(streams)
+            try:
+                while remaining:
+                    page = pages.get()
+                    if page is done:
+                        remaining -= 1
+                    elif isinstance(page, Exception):
+                        raise page
+                    else:
+                        yield page
+            finally:
+                stop.set()
+
+    def iter_batches(self, max_rows:int = 100000, max_bytes:int = None, as_dataframe:bool = True, parallel_streams:int = 1, max_queue_size:int = 2):
+        '''
+        Streams the results of the query in chunks of bounded size instead of a single dataframe
+        Peak memory is about (max_queue_size + 1) chunks
+        
+                Parameters:
+                        max_rows* (int): max number of rows per chunk
+                        max_bytes* (int): max size of a chunk in bytes, estimated from the first page
+                        as_dataframe* (bool): yields pandas dataframes if True, pyarrow record batches otherwise
+                        parallel_streams* (int): number of Storage Read API streams read in parallel (requires google-cloud-bigquery-storage)
+                        max_queue_size* (int): number of pages buffered ahead of the consumer
+        '''
+        query_job = self.client.query(self.query)
+        rows = query_job.result(page_size=max_rows)  # Waits for job to complete.
+        registry.record_job(query_job)
+        bqstorage_client = self._bqstorage_client()
+        if bqstorage_client is not None and parallel_streams > 1 and query_job.destination is not None:
+            pages = self._read_streams(query_job, bqstorage_client, parallel_streams, max_queue_size)
+        else:
+            pages = rows.to_arrow_iterable(bqstorage_client=bqstorage_client, max_queue_size=max_queue_size)
+
+        for page in pages:
+            batches = page.to_batches() if hasattr(page, 'to_batches') else [page]
+            for batch in batches:
+                registry.transferred('bigquery', 'download', batch.nbytes)
+                chunk_rows = max_rows
+                if max_bytes and batch.num_rows:
+                    chunk_rows = max(1, min(max_rows, int(max_bytes / (batch.nbytes / batch.num_rows))))
+                for offset in range(0, batch.num_rows, chunk_rows):
+                    chunk = batch.slice(offset, chunk_rows)
+                    yield(chunk.to_pandas() if as_dataframe else chunk)
+
+    def to_parquet(self, path:str, **kwargs):
+        '''
+        Writes the results of the query to a local parquet file one chunk at a time
+        
+                Parameters:
+                        path (str): parquet file path
+                        kwargs: parameters of iter_batches
+        '''
+        import pyarrow.parquet as pq
+
+        writer, num_rows = None, 0
+        for batch in self.iter_batches(as_dataframe=False, **kwargs):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_batch(batch)
+            num_rows += batch.num_rows
+        if writer is not None:
+            writer.close()
+        echo(f"> Wrote {num_rows} rows to {path}")
+        return(num_rows)
+
+#-------------------------------
+#          Query template
+#-------------------------------
+
+class QueryTemplate:
+    '''
+    Query run for many values of a query parameter, several values per job
+            Parameters:
+                    client (object): bigquery client
+                    query (str): SQL using the parameter as @name, ex: "SELECT ... WHERE var = @var"
+                    name* (str): name of the query parameter
+                    param_type* (str): BigQuery type of the parameter, ex: INT64, STRING, DATE
+                    key_column* (str): column holding the parameter value in the results, required by the array mode
+    '''
+    modes = ('single', 'union', 'array', 'script')
+
+    def __init__(self, client, query:str, name:str = 'var', param_type:str = 'INT64', key_column:str = None):
+        self.client = instrument(client)
+        self.query = query
+        self.name = name
+        self.param_type = param_type
+        self.key_column = key_column
+        self.report = None
+
+    def _renamed(self, name:str):
+        return(re.sub(rf'@{self.name}\b', f'@{name}', self.query))
+
+    def _array_sql(self):
+        # "= @name" filters turned into "IN UNNEST(@name)", None if the parameter is used in any other position
+        # (ex: != @name, @name + 1), the IN filter would change the meaning of those
+        sql, count = re.subn(rf'(?<![!<>])=\s*@{self.name}\b', f'IN UNNEST(@{self.name})', self.query)
+        if not count or re.search(rf'(?<!UNNEST\()@{self.name}\b', sql):
+            return(None)
+        return(sql)
+
+    def batch_job(self, values:list, mode:str):
+        '''
+        SQL and query parameters of a job running several values
+        
+                Parameters:
+                        values (list): parameter values of the job
+                        mode (str): 'single' runs one value per job,
+                                    'union' runs a UNION ALL of the query for each value with a __key column,
+                                    'array' turns "= @name" into "IN UNNEST(@name)", the table is scanned once,
+                                    requires @name to appear only in such filters (run falls back to union otherwise),
+                                    'script' runs one statement per value in a multi-statement job
+
+                Returns:
+                        sql (str), query_parameters (list)
+        '''
+        assert mode in self.modes, f'mode must be one of {self.modes}'
+        if mode == 'single':
+            assert len(values) == 1, 'the single mode runs one value per job'
+            return(self.query, [bigquery.ScalarQueryParameter(self.name, self.param_type, values[0])])
+        if mode == 'array':
+            if self.key_column is None:
+                raise ValueError("the array mode requires the key_column holding the parameter value")
+            sql = self._array_sql()
+            if sql is None:
+                raise ValueError(f"the array mode requires @{self.name} to be used only in '= @{self.name}' filters")
+            return(sql, [bigquery.ArrayQueryParameter(self.name, self.param_type, list(values))])
+
+        names = [f"{self.name}_{num}" for num in range(len(values))]
+        selects = [f"SELECT @{name} AS __key, * FROM (\n{self._renamed(name)}\n)" for name in names]
+        separator = "\nUNION ALL\n" if mode == 'union' else ";\n"
+        parameters = [bigquery.ScalarQueryParameter(name, self.param_type, value) for name, value in zip(names, values)]
+        return(separator.join(selects), parameters)
+
+    def _result(self, query_job, mode:str):
+        import pandas as pd
+
+        if mode != 'script':
+            return(query_job.to_dataframe())
+        # a script returns the rows of its last statement, each SELECT is read from its child job
+        query_job.result()
+        children = self.client.list_jobs(parent_job=query_job.job_id)  # Make an API request.
+        frames = [child.to_dataframe() for child in children if child.statement_type == 'SELECT']
+        return(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['__key']))
+
+    @registry.traced('query_template.run')
+    def run(self, values:list, batch_size:int = 50, mode:str = 'union'):
+        '''
+        Runs the query for every value, the jobs of all the batches run concurrently
+        
+                Parameters:
+                        values (list): parameter values
+                        batch_size* (int): number of values per job, ignored in single mode
+                        mode* (str): see QueryTemplate.batch_job
+
+                Returns:
+                        results (dict): value -> dataframe of the rows of that value
+        '''
+        values = list(values)
+        if mode == 'array' and (self.key_column is None or self._array_sql() is None):
+            echo(Fore.YELLOW + f"> @{self.name} can't be turned into an array filter, running in union mode" + Style.RESET_ALL)
+            mode = 'union'
+        batch_size = 1 if mode == 'single' else batch_size
+        started = datetime.now()
+        jobs = []
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            sql, parameters = self.batch_job(batch, mode)
+            job_config = bigquery.QueryJobConfig(query_parameters=parameters)
+            jobs.append((self.client.query(sql, job_config=job_config), batch))  # Make an API request.
+
+        results = {}
+        key = self.key_column if mode == 'array' else '__key'
+        for query_job, batch in jobs:
+            df = self._result(query_job, mode)
+            if mode == 'single':
+                results[batch[0]] = df
+                continue
+            for value in batch:
+                rows = df[df[key] == value]
+                results[value] = (rows.drop(columns='__key') if key == '__key' else rows).reset_index(drop=True)
+
+        seconds = max((datetime.now() - started).total_seconds(), 1e-6)
+        self.report = {
+            'mode': mode,
+            'values': len(values),
+            'jobs': len(jobs),
+            'wall_time_s': round(seconds, 3),
+            'jobs_per_s': round(len(jobs) / seconds, 2),
+            'values_per_s': round(len(values) / seconds, 2),
+            'total_bytes_billed': sum(query_job.total_bytes_billed or 0 for query_job, _ in jobs),
+        }
+        echo(Fore.GREEN + f"> {len(values)} values in {len(jobs)} {mode} jobs, {seconds:.1f}s (ಠ‿↼)")
+        echo(Fore.MAGENTA + f"> {self.report['values_per_s']} values/s, {self.report['total_bytes_billed']} bytes billed")
+        echo(Style.RESET_ALL)
+        return(results)
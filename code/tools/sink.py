@@ -0,0 +1,180 @@
+'''
+Worker-side buffering of result rows for a single coordinator load
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import base64
+import math
+import socket
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+from .metadata import MetadataCache
+from .storage import new_storage_client
+
+
+#-------------------------------
+#          Result sink
+#-------------------------------
+
+def _json_value(value):
+    '''
+    JSON-safe value of a streamed cell: dates and times as ISO strings, numpy scalars as python values, NaN as null
+    '''
+    if isinstance(value, (datetime, date, time)):
+        return(value.isoformat())
+    if isinstance(value, Decimal):
+        return(str(value))
+    if isinstance(value, bytes):
+        return(base64.b64encode(value).decode())
+    if hasattr(value, 'item') and not isinstance(value, (list, dict, str)):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return(None)
+    return(value)
+
+
+class ResultSink:
+    '''
+    Buffers result rows on a worker and flushes them as parquet files to a bucket staging prefix,
+    or as batched streaming inserts. ResultSink.commit then loads the files of every worker with a single load job.
+            Parameters:
+                    client (object): bigquery client
+                    bucket_name (str): staging GCS bucket, ignored in stream mode
+                    prefix (str): staging folder shared by the workers, ex: staging/test/runner_logs
+                    flush_rows* (int): number of buffered rows triggering a flush
+                    mode* (str): 'files' to stage parquet files, 'stream' for streaming inserts into endpoint
+                    endpoint* (Table obj): destination table of the stream mode
+                    storage_client* (storage.Client): defaults to a client on the bigquery client project
+    '''
+    def __init__(self, client, bucket_name:str = None, prefix:str = "staging", flush_rows:int = 10000, mode:str = 'files',
+                 endpoint = None, storage_client = None):
+        assert mode in ('files', 'stream'), 'mode must be files or stream'
+        assert mode == 'files' or endpoint is not None, 'the stream mode requires an endpoint'
+        self.client = instrument(client)
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.flush_rows = flush_rows
+        self.mode = mode
+        self.endpoint = endpoint
+        self.storage_client = instrument(storage_client)
+        # the instance name on compute engine workers
+        self.worker = socket.gethostname()
+        self.columns = {}
+        self.num_rows = 0
+        self.files = []
+
+    def add(self, row:dict):
+        '''
+        Buffers a row, missing columns are filled with None
+        '''
+        for column in row:
+            if column not in self.columns:
+                self.columns[column] = [None] * self.num_rows
+        for column, values in self.columns.items():
+            values.append(row.get(column))
+        self.num_rows += 1
+        if self.num_rows >= self.flush_rows:
+            self.flush()
+
+    def extend(self, rows:list):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        '''
+        Sends the buffered rows
+        '''
+        if not self.num_rows:
+            return
+        if self.mode == 'files':
+            import pandas as pd
+
+            self.storage_client = self.storage_client or new_storage_client(self.client.project)
+            name = f"{self.prefix}/{self.worker}-{uuid.uuid4().hex[:12]}.parquet"
+            data = pd.DataFrame(self.columns).to_parquet(index=False)
+            with registry.call('storage', 'upload'):
+                self.storage_client.bucket(self.bucket_name).blob(name).upload_from_string(data)
+            registry.transferred('storage', 'upload', len(data))
+            self.files.append(name)
+            echo(f"> Staged {self.num_rows} rows in gs://{self.bucket_name}/{name}")
+        else:
+            table_id = f'{self.endpoint.project}.{self.endpoint.dataset}.{self.endpoint.table}'
+            names = list(self.columns)
+            rows = [dict(zip(names, map(_json_value, values))) for values in zip(*self.columns.values())]
+            for start in range(0, len(rows), 500):
+                errors = self.client.insert_rows_json(table_id, rows[start:start + 500])  # Make an API request.
+                if errors:
+                    raise BadRequest(f"Streaming insert into {table_id} failed: {errors[:3]}")
+            MetadataCache.shared(self.client).invalidate(table_id)
+            echo(f"> Streamed {self.num_rows} rows to {table_id}")
+        self.columns = {}
+        self.num_rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def commit(client, bucket_name:str, prefix:str, endpoint, write_disposition:str = 'WRITE_APPEND', schema = None,
+               storage_client = None, cleanup:bool = True, schema_update_options = None):
+        '''
+        Coordinator step: loads the files staged by every worker with a single load job
+        
+                Parameters:
+                        client (object): bigquery client
+                        bucket_name (str): staging GCS bucket
+                        prefix (str): staging folder of the workers
+                        endpoint (Table obj): destination table
+                        write_disposition (str): default is set to 'WRITE_APPEND'
+                        schema (list[bigquery.SchemaField]): explicit schema of the table
+                        cleanup (bool): if set to True, deletes the staged files once loaded
+                        schema_update_options (list[str]): ex: [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+                            to append columns missing from the destination table
+        '''
+        client = instrument(client)
+        storage_client = instrument(storage_client or new_storage_client(client.project))
+        prefix = prefix.strip('/')
+        blobs = [blob for blob in storage_client.list_blobs(bucket_name, prefix=f"{prefix}/") if blob.name.endswith('.parquet')]
+        table_id = f'{endpoint.project}.{endpoint.dataset}.{endpoint.table}'
+        if not blobs:
+            echo(f"> Nothing staged in gs://{bucket_name}/{prefix}")
+            return(None)
+
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=write_disposition,
+        )
+        if schema:
+            job_config.schema = schema
+        if schema_update_options:
+            job_config.schema_update_options = schema_update_options
+        echo(f'> Loading {len(blobs)} staged files to table {table_id}')
+        # a load job takes at most 10,000 source URIs
+        for start in range(0, len(blobs), 10000):
+            job = client.load_table_from_uri(
+                [f"gs://{bucket_name}/{blob.name}" for blob in blobs[start:start + 10000]], table_id, job_config=job_config
+            )  # Make an API request.
+            with registry.call('bigquery', 'load'):
+                job.result()  # Waits for job to complete.
+            MetadataCache.shared(client).invalidate(table_id)
+            job_config.write_disposition = 'WRITE_APPEND'
+            echo(Fore.GREEN + f"> Loaded {job.output_rows} rows to {table_id} (ಠ‿↼)" + Style.RESET_ALL)
+        if cleanup:
+            for blob in blobs:
+                blob.delete()
+        return(job)
@@ -0,0 +1,262 @@
+'''
+GCS bucket transfers and listings
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import fnmatch
+import os
+import re
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.exceptions import NotFound
+from instrumentation import echo, instrument, registry
+
+from ._display import Fore, Style
+
+
+#-------------------------------
+#          Storage
+#------------------------------- 
+
+def new_storage_client(project):
+    '''
+    GCS client of the project, google.cloud.storage is only imported by the tools staging through a bucket
+            Parameters:
+                    project (str): id of the GCP project
+            Returns:
+                    client (object): instrumented google.cloud.storage client
+    '''
+    from google.cloud import storage
+
+    return(instrument(storage.Client(project=project)))
+
+
+class Bucket:
+    '''
+    GCS bucket of the project, a single bucket handle is reused by every call
+            Parameters:
+                    client (object): google.cloud.storage client
+                    bucket_name (str): name of the GCS bucket
+    '''
+    def __init__(self, client, bucket_name:str):
+        self.bucket_name = bucket_name
+        self.client = instrument(client)
+        # no API request, the bucket metadata is never needed to read or write objects
+        self.bucket = client.bucket(bucket_name)
+    
+    def blob_exists(self, filename:str):
+        '''
+        Checks if a file exists in the bucket
+        '''
+
+        echo(f"Checking {filename} in {self.bucket_name}")
+        blob = self.bucket.blob(filename)
+        with registry.call('storage', 'exists'):
+            return (blob.exists())
+
+    def upload_blob(self, source_file_name:str, destination_blob_name:str):
+        '''
+        Uploads a file to the bucket
+        '''
+        blob = self.bucket.blob(destination_blob_name)
+
+        with registry.call('storage', 'upload'):
+            blob.upload_from_filename(source_file_name)
+        registry.transferred('storage', 'upload', os.path.getsize(source_file_name))
+
+        return(
+            "File {} uploaded to {} GCS directory.".format(
+                source_file_name, destination_blob_name
+            )
+        )
+
+    def download_blob(self, destination_blob_name, destination_file_name):
+        '''
+        Downloads a file to the bucket
+        '''
+        blob = self.bucket.blob(destination_blob_name)
+        with registry.call('storage', 'download'):
+            blob.download_to_filename(destination_file_name)
+        registry.transferred('storage', 'download', os.path.getsize(destination_file_name))
+
+        return(
+            "GCS file {} downloaded to {}.".format(
+                destination_blob_name, destination_file_name
+            )
+        )
+
+    def _upload_composite(self, source_file_name:str, destination_blob_name:str, size:int, parts:int, executor):
+        # each part is uploaded as a temporary object, then composed server side (at most 32 sources)
+        part_size = -(-size // parts)
+        names = []
+        futures = []
+        for num, start in enumerate(range(0, size, part_size)):
+            names.append(f"{destination_blob_name}.part-{num:02d}-{uuid.uuid4().hex[:8]}")
+            futures.append(executor.submit(self._upload_part, source_file_name, names[-1], start, min(part_size, size - start)))
+        try:
+            for future in futures:
+                future.result()
+            blob = self.bucket.blob(destination_blob_name)
+            with registry.call('storage', 'compose'):
+                blob.compose([self.bucket.blob(name) for name in names])  # Make an API request.
+        finally:
+            for name in names:
+                try:
+                    self.bucket.blob(name).delete()
+                except NotFound:
+                    pass
+
+    def _upload_part(self, source_file_name:str, blob_name:str, start:int, size:int):
+        with open(source_file_name, 'rb') as file:
+            file.seek(start)
+            with registry.call('storage', 'upload'):
+                self.bucket.blob(blob_name).upload_from_file(file, size=size)
+        registry.transferred('storage', 'upload', size)
+
+    def _download_slice(self, blob_name:str, destination_file_name:str, start:int, end:int):
+        with open(destination_file_name, 'r+b') as file:
+            file.seek(start)
+            with registry.call('storage', 'download'):
+                self.bucket.blob(blob_name).download_to_file(file, start=start, end=end)
+        registry.transferred('storage', 'download', end - start + 1)
+
+    def _transfer_report(self, action:str, sizes:dict, failures:dict, started:datetime):
+        seconds = max((datetime.now() - started).total_seconds(), 1e-6)
+        transferred = sum(size for name, size in sizes.items() if name not in failures)
+        report = {
+            'files': len(sizes) - len(failures),
+            'failures': failures,
+            'bytes': transferred,
+            'seconds': round(seconds, 3),
+            'mb_per_s': round(transferred / 2**20 / seconds, 2),
+        }
+        echo(Fore.GREEN + f"> {action} {report['files']} files ({transferred / 2**20:.1f} MB) in {seconds:.1f}s (ಠ‿↼)" + Style.RESET_ALL)
+        echo(Fore.MAGENTA + f"> {report['mb_per_s']} MB/s" + Style.RESET_ALL)
+        if failures:
+            echo(Fore.RED + f"> {len(failures)} files FAILED (ಠ_ಠ)" + Style.RESET_ALL)
+        return(report)
+
+    def upload_many(self, files:dict, workers:int = 8, chunk_size:int = None, composite_threshold:int = None,
+                    composite_parts:int = 8):
+        '''
+        Uploads files to the bucket in parallel
+
+                Parameters:
+                        files (dict): local file path -> destination blob name
+                        workers* (int): number of parallel uploads
+                        chunk_size* (int): if set, files are sent as resumable uploads of chunk_size bytes (multiple of 256 KB)
+                        composite_threshold* (int): files larger than this size (bytes) are split in composite_parts
+                                                    parts uploaded in parallel and composed in the bucket.
+                                                    Composite objects have a crc32c but no md5 checksum.
+                        composite_parts* (int): number of parts of a composite upload, max 32
+
+                Returns:
+                        report (dict): files, failures (file -> error), bytes, seconds and mb_per_s
+        '''
+        assert 1 < composite_parts <= 32, 'composite_parts must be between 2 and 32'
+        started = datetime.now()
+        sizes = {source: os.path.getsize(source) for source in files}
+        failures = {}
+
+        def upload(source):
+            blob = self.bucket.blob(files[source])
+            if chunk_size:
+                blob.chunk_size = chunk_size
+            with registry.call('storage', 'upload'):
+                blob.upload_from_filename(source)  # Make an API request.
+            registry.transferred('storage', 'upload', sizes[source])
+
+        # the parts of composite uploads run on their own pool, a file never waits on a busy worker slot
+        with ThreadPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=workers) as parts:
+            futures = {}
+            for source, size in sizes.items():
+                if composite_threshold and size > composite_threshold:
+                    futures[executor.submit(self._upload_composite, source, files[source], size, composite_parts, parts)] = source
+                else:
+                    futures[executor.submit(upload, source)] = source
+            for future, source in futures.items():
+                if future.exception() is not None:
+                    failures[source] = future.exception()
+        return(self._transfer_report('Uploaded', sizes, failures, started))
+
+    def download_many(self, files:dict, workers:int = 8, slice_threshold:int = None, slice_parts:int = 8):
+        '''
+        Downloads blobs of the bucket in parallel
+
+                Parameters:
+                        files (dict): blob name -> local destination path
+                        workers* (int): number of parallel downloads
+                        slice_threshold* (int): blobs larger than this size (bytes) are downloaded as slice_parts
+                                                byte ranges in parallel. Costs one metadata request per blob.
+                        slice_parts* (int): number of byte ranges of a sliced download
+
+                Returns:
+                        report (dict): files, failures (blob -> error), bytes, seconds and mb_per_s
+        '''
+        started = datetime.now()
+        sizes = dict.fromkeys(files, 0)
+        failures = {}
+
+        def download(name):
+            destination = files[name]
+            os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+            if slice_threshold:
+                with registry.call('storage', 'get_blob'):
+                    blob = self.bucket.get_blob(name)  # Make an API request.
+                if blob is None:
+                    raise NotFound(f"gs://{self.bucket_name}/{name}")
+                sizes[name] = blob.size
+                if blob.size > slice_threshold:
+                    with open(destination, 'wb') as file:
+                        file.truncate(blob.size)
+                    part_size = -(-blob.size // slice_parts)
+                    ranges = [(start, min(start + part_size, blob.size) - 1) for start in range(0, blob.size, part_size)]
+                    for future in [slices.submit(self._download_slice, name, destination, start, end) for start, end in ranges]:
+                        future.result()
+                    return
+            with registry.call('storage', 'download'):
+                self.bucket.blob(name).download_to_filename(destination)  # Make an API request.
+            sizes[name] = os.path.getsize(destination)
+            registry.transferred('storage', 'download', sizes[name])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=workers) as slices:
+            futures = {executor.submit(download, name): name for name in files}
+            for future, name in futures.items():
+                if future.exception() is not None:
+                    failures[name] = future.exception()
+        return(self._transfer_report('Downloaded', sizes, failures, started))
+
+    def iter_files(self, prefix:str = None, pattern:str = None, page_size:int = 1000):
+        '''
+        Lazily lists the files of the bucket, one page at a time
+
+                Parameters:
+                        prefix* (str): folder of the files, ex: staging/test
+                        pattern* (str): glob on the full blob name, ex: staging/*/runner_logs/*.parquet.
+                                        Defaults the prefix to the part of the pattern before the first wildcard.
+                        page_size* (int): number of blobs per listing request
+
+                Yields:
+                        file (dict): name, size (bytes), generation and updated of each file
+        '''
+        if pattern and prefix is None:
+            prefix = re.split(r'[*?\[]', pattern, 1)[0]
+        blobs = self.client.list_blobs(
+            self.bucket_name, prefix=prefix, page_size=page_size,
+            fields='items(name,size,generation,updated),nextPageToken',
+        )  # Make an API request per page.
+        for blob in blobs:
+            if pattern and not fnmatch.fnmatchcase(blob.name, pattern):
+                continue
+            yield {'name': blob.name, 'size': blob.size, 'generation': blob.generation, 'updated': blob.updated}
+
+    def list_files(self, prefix=None):
+        '''
+        Lists all the files contained in a bucket
+        '''
+        return([file['name'] for file in self.iter_files(prefix)])
@@ -0,0 +1,12 @@
+'''
+Parallel engine fleet tooling, used from runner.ipynb
+'''
+
+from .launcher import Launcher, LaunchReport
+from .fake import FakeCompute, FakeBigQuery, FakeStorage
+from .quota import AdmissionController
+from .taskqueue import LocalTaskQueue, GCSTaskQueue, launch_agents
+from .sweep import Sweep, RuntimeHistory
+from .monitor import FleetMonitor, LocalMarkers, GCSMarkers
+from .phases import PhaseCollector
+from .instrumentation import registry, set_output
@@ -0,0 +1,766 @@
+'''
+In-memory stand-ins for the compute engine, BigQuery and GCS clients.
+They mimic the subset of googleapiclient.discovery.build('compute', 'v1'),
+bigquery.Client and storage.Client used by the launcher and code/tools, so
+fleets, jobs and transfers can be launched and measured without GCP.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+
+#-------------------------------
+#        requests
+#-------------------------------
+
+class FakeRequest:
+    '''
+    Lazy request returned by every fake API method, executed with .execute()
+    '''
+    def __init__(self, compute, fn):
+        self.compute = compute
+        self.fn = fn
+
+    def execute(self):
+        self.compute._sleep(self.compute.latency)
+        return(self.fn())
+
+
+class FakeBatch:
+    '''
+    Mimics googleapiclient.http.BatchHttpRequest: requests are queued with add()
+    and sent in a single round trip by execute()
+    '''
+    def __init__(self, compute, callback=None):
+        self.compute = compute
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests))
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.compute._sleep(self.compute.latency)
+        with self.compute.lock:
+            self.compute.calls['batch'] += 1
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                response = request.fn()
+            except Exception as e:
+                exception = e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeHttpError(Exception):
+    '''
+    Raised by the fake client where the real one raises googleapiclient.errors.HttpError
+    '''
+    def __init__(self, status, message):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.status = status
+        self.message = message
+
+
+#-------------------------------
+#        resources
+#-------------------------------
+
+class _Resource:
+    def __init__(self, compute):
+        self.compute = compute
+
+    def _request(self, name, fn):
+        with self.compute.lock:
+            self.compute.calls[name] = self.compute.calls.get(name, 0) + 1
+        return(FakeRequest(self.compute, fn))
+
+
+class _Instances(_Resource):
+
+    def insert(self, project, zone, body):
+        return(self._request('instances.insert', lambda: self.compute._insert(zone, body)))
+
+    def bulkInsert(self, project, zone, body):
+        return(self._request('instances.bulkInsert', lambda: self.compute._bulk_insert(zone, body)))
+
+    def delete(self, project, zone, instance):
+        return(self._request('instances.delete', lambda: self.compute._delete(zone, instance)))
+
+    def get(self, project, zone, instance):
+        return(self._request('instances.get', lambda: self.compute._get_instance(zone, instance)))
+
+    def list(self, project, zone, filter=None, maxResults=500, pageToken=None):
+        return(self._request('instances.list', lambda: self.compute._list_instances(zone, maxResults, pageToken)))
+
+    def list_next(self, previous_request, previous_response):
+        token = previous_response.get('nextPageToken')
+        if not token:
+            return(None)
+        zone = previous_response['zone']
+        return(self._request('instances.list', lambda: self.compute._list_instances(zone, 500, token)))
+
+
+class _ZoneOperations(_Resource):
+
+    def get(self, project, zone, operation):
+        return(self._request('zoneOperations.get', lambda: self.compute._get_operation(operation)))
+
+
+class _Images(_Resource):
+
+    def getFromFamily(self, project, family):
+        link = f"https://www.googleapis.com/compute/v1/projects/{project}/global/images/{family}-v20221004"
+        return(self._request('images.getFromFamily', lambda: {'name': f'{family}-v20221004', 'selfLink': link}))
+
+
+#-------------------------------
+#        client
+#-------------------------------
+
+class FakeCompute:
+    '''
+    Thread-safe fake compute client
+            Parameters:
+                    latency (float): seconds spent in every API round trip
+                    operation_time (float): seconds before an insert/delete operation is DONE
+                    boot_time (float): seconds between a DONE insert and the instance reaching RUNNING
+                    run_time (float): seconds an instance runs before deleting itself, as the startup script does, None to run forever
+                    quota (int): max number of instances in the zone, inserts beyond it fail with QUOTA_EXCEEDED
+                    failure_rate (float): probability for an insert operation to end in error
+                    seed (int): seed of the failure generator
+    '''
+    def __init__(self, latency=0.0, operation_time=0.0, boot_time=0.0, run_time=None, quota=None, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.operation_time = operation_time
+        self.boot_time = boot_time
+        self.run_time = run_time
+        self.quota = quota
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {'batch': 0}
+        self.vms = {}
+        self.ops = {}
+        self._ids = itertools.count(1)
+
+    def _sleep(self, seconds):
+        if seconds:
+            time.sleep(seconds)
+
+    # googleapiclient exposes resources as methods
+    def instances(self):
+        return(_Instances(self))
+
+    def zoneOperations(self):
+        return(_ZoneOperations(self))
+
+    def images(self):
+        return(_Images(self))
+
+    def new_batch_http_request(self, callback=None):
+        return(FakeBatch(self, callback))
+
+    def _new_operation(self, zone, kind, target, error=None):
+        name = f"operation-{next(self._ids)}-{kind}"
+        operation = {
+            'name': name,
+            'zone': zone,
+            'operationType': kind,
+            'targetLink': target,
+            'status': 'RUNNING',
+            'insertTime': time.time(),
+            '_done_at': time.time() + self.operation_time,
+        }
+        if error:
+            operation['_error'] = {'errors': [error]}
+        self.ops[name] = operation
+        return(operation)
+
+    def _public(self, operation):
+        return({k: v for k, v in operation.items() if not k.startswith('_')})
+
+    def _check_insert(self, zone, names):
+        error = None
+        if any(name in self.vms for name in names):
+            error = {'code': 'RESOURCE_ALREADY_EXISTS', 'message': f"The resource '{names[0]}' already exists"}
+        elif self.quota is not None and len(self.vms) + len(names) > self.quota:
+            error = {'code': 'QUOTA_EXCEEDED', 'message': f"Quota 'INSTANCES' exceeded. Limit: {self.quota}"}
+        elif self.random.random() < self.failure_rate:
+            error = {'code': 'ZONE_RESOURCE_POOL_EXHAUSTED', 'message': f"The zone '{zone}' does not have enough resources"}
+        return(error)
+
+    def _create(self, zone, name, metadata):
+        self.vms[name] = {
+            'name': name,
+            'zone': zone,
+            'status': 'PROVISIONING',
+            'metadata': metadata,
+            '_created': time.time(),
+        }
+
+    def _insert(self, zone, body):
+        name = body['name']
+        with self.lock:
+            self._expire()
+            error = self._check_insert(zone, [name])
+            if not error:
+                self._create(zone, name, body.get('metadata', {}))
+            operation = self._new_operation(zone, 'insert', name, error)
+            return(self._public(operation))
+
+    def _bulk_insert(self, zone, body):
+        # all or nothing, as bulkInsert with the default minCount
+        names = list(body['perInstanceProperties'])[:body['count']]
+        with self.lock:
+            self._expire()
+            error = self._check_insert(zone, names)
+            if not error:
+                for name in names:
+                    self._create(zone, name, body['instanceProperties'].get('metadata', {}))
+            operation = self._new_operation(zone, 'bulkInsert', zone, error)
+            return(self._public(operation))
+
+    def _delete(self, zone, name):
+        with self.lock:
+            if name not in self.vms:
+                raise FakeHttpError(404, f"The resource '{name}' was not found")
+            self.vms[name]['status'] = 'STOPPING'
+            operation = self._new_operation(zone, 'delete', name)
+            operation['_deletes'] = name
+            return(self._public(operation))
+
+    def _get_operation(self, name):
+        with self.lock:
+            if name not in self.ops:
+                raise FakeHttpError(404, f"The resource '{name}' was not found")
+            operation = self.ops[name]
+            if operation['status'] != 'DONE' and time.time() >= operation['_done_at']:
+                operation['status'] = 'DONE'
+                if '_error' in operation:
+                    operation['error'] = operation['_error']
+                if '_deletes' in operation:
+                    self.vms.pop(operation['_deletes'], None)
+            return(self._public(operation))
+
+    def _expire(self):
+        if self.run_time is None:
+            return
+        now = time.time()
+        for name in [n for n, i in self.vms.items() if now - i['_created'] >= self.boot_time + self.run_time]:
+            del self.vms[name]
+
+    def _refresh(self, instance):
+        if instance['status'] == 'PROVISIONING' and time.time() - instance['_created'] >= self.boot_time:
+            instance['status'] = 'RUNNING'
+        return({k: v for k, v in instance.items() if not k.startswith('_')})
+
+    def _get_instance(self, zone, name):
+        with self.lock:
+            self._expire()
+            if name not in self.vms:
+                raise FakeHttpError(404, f"The resource '{name}' was not found")
+            return(self._refresh(self.vms[name]))
+
+    def _list_instances(self, zone, max_results, page_token):
+        with self.lock:
+            self._expire()
+            items = [self._refresh(i) for i in self.vms.values() if i['zone'] == zone]
+        start = int(page_token or 0)
+        result = {'zone': zone}
+        if items[start:start + max_results]:
+            result['items'] = items[start:start + max_results]
+        if start + max_results < len(items):
+            result['nextPageToken'] = str(start + max_results)
+        return(result)
+
+
+#-------------------------------
+#        errors
+#-------------------------------
+
+def _google_error(status, message, reason=None):
+    # the tools catch the google.api_core exceptions, raised when the library is installed
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return(FakeHttpError(status, message))
+    # the reason of the real error payload, ex: rateLimitExceeded
+    errors = [{'reason': reason, 'message': message}] if reason else ()
+    return(exceptions.from_http_status(status, message, errors=errors))
+
+
+def _table_id(table):
+    # project.dataset.table of a table id, reference or table
+    if hasattr(table, 'table_id'):
+        return(f"{table.project}.{table.dataset_id}.{table.table_id}")
+    return(str(table).split('$')[0])
+
+
+class _Calls:
+    '''
+    API call counters and latency shared by the fake BigQuery and GCS clients
+    '''
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise _google_error(503, f"{name}: backend error")
+
+
+#-------------------------------
+#        bigquery
+#-------------------------------
+
+class FakeTable:
+    def __init__(self, table_id, num_rows=0, num_bytes=0, schema=None):
+        self.project, self.dataset_id, self.table_id = table_id.split('.')
+        self.num_rows = num_rows
+        self.num_bytes = num_bytes
+        self.schema = schema or []
+        self.modified = datetime.now(timezone.utc)
+        self.streaming_buffer = None
+        self.expires = None
+
+
+class FakeJob:
+    '''
+    Query, load or extract job, RUNNING until its duration has elapsed
+    '''
+    def __init__(self, client, job_type, duration, query=None, destination=None, bytes_processed=0, num_rows=0,
+                 error=None, dry_run=False):
+        self._client = client
+        self.job_type = job_type
+        self.job_id = f"job_{uuid.uuid4().hex[:20]}"
+        self.location = 'EU'
+        self.query = query
+        self.destination = destination
+        self.created = datetime.now(timezone.utc)
+        self.started = self.created
+        self.ended = None
+        self.user_email = 'bench@example.com'
+        self.dry_run = dry_run
+        self.statement_type = 'SELECT' if job_type == 'query' else None
+        self.total_bytes_processed = bytes_processed
+        self.total_bytes_billed = 0 if dry_run else bytes_processed
+        self.output_rows = num_rows
+        self._num_rows = num_rows
+        self._done_at = time.time() + (0 if dry_run else duration)
+        self._error = error
+        self.error_result = None
+        self.errors = None
+        self.state = 'RUNNING'
+        self._update()
+
+    def _update(self):
+        if self.state != 'DONE' and time.time() >= self._done_at:
+            self.state = 'DONE'
+            self.ended = datetime.fromtimestamp(self._done_at, timezone.utc)
+            if self._error:
+                self.error_result = {'reason': 'backendError', 'message': self._error}
+                self.errors = [self.error_result]
+            elif self.destination is not None and not self.dry_run:
+                self._client._write(self.destination, self._num_rows, self.total_bytes_processed)
+        return(self)
+
+    def done(self):
+        return(self._update().state == 'DONE')
+
+    def reload(self, **kwargs):
+        self._client._call('jobs.get')
+        self._update()
+
+    def result(self, timeout=None, page_size=None, **kwargs):
+        # the library polls getQueryResults with a long timeout, one counted call per wait
+        self._client._call('jobs.getQueryResults')
+        time.sleep(max(0.0, self._done_at - time.time()))
+        self._update()
+        if self.error_result:
+            raise _google_error(400, self._error)
+        return(self)
+
+    def to_dataframe(self, **kwargs):
+        import pandas as pd
+
+        self.result()
+        return(pd.DataFrame({'row': range(self._num_rows)}))
+
+
+class FakeBigQuery(_Calls):
+    '''
+    Thread-safe fake bigquery client
+            Parameters:
+                    project (str): project of the client
+                    latency (float): seconds spent in every API round trip
+                    job_time (float): seconds a query job runs
+                    job_jitter (float): random extra seconds, up to job_jitter, added to every job
+                    bytes_per_query (int): bytes processed (and billed) by each query
+                    rows_per_query (int): rows returned by each query
+                    load_throughput (float): bytes/s of the load jobs
+                    failure_rate (float): probability for a job to end in error
+                    error_rate (float): probability for an API call to fail with a 503
+                    max_concurrent_jobs (int): running query and load jobs, inserts beyond it fail with a 403 rateLimitExceeded
+                    max_load_jobs_per_table (int): load jobs of a table, inserts beyond it fail with a 403 quotaExceeded
+                    storage (FakeStorage): client holding the files read by load_table_from_uri
+                    seed (int): seed of the random generator
+    '''
+    # label of the calls in the instrumentation registry
+    service = 'bigquery'
+
+    def __init__(self, project='bench-project', latency=0.0, job_time=1.0, job_jitter=0.0, bytes_per_query=10 * 2**20,
+                 rows_per_query=100, load_throughput=200 * 2**20, failure_rate=0.0, error_rate=0.0,
+                 max_concurrent_jobs=None, max_load_jobs_per_table=None, storage=None, seed=None):
+        self.project = project
+        self.location = 'EU'
+        self.latency = latency
+        self.job_time = job_time
+        self.job_jitter = job_jitter
+        self.bytes_per_query = bytes_per_query
+        self.rows_per_query = rows_per_query
+        self.load_throughput = load_throughput
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_load_jobs_per_table = max_load_jobs_per_table
+        self.storage = storage
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.jobs = {}
+        self.load_jobs = {}
+        self.datasets = set()
+        self.tables = {}
+
+    def _duration(self, seconds):
+        with self.lock:
+            return(seconds + self.random.uniform(0, self.job_jitter))
+
+    def _check_quotas(self, job_type, destination=None, dry_run=False, **kwargs):
+        # the same errors as the API, a dry run is not a job
+        if dry_run:
+            return
+        if self.max_concurrent_jobs is not None:
+            with self.lock:
+                jobs = list(self.jobs.values())
+            running = sum(1 for job in jobs if job._update().state != 'DONE')
+            if running >= self.max_concurrent_jobs:
+                raise _google_error(403, f"Exceeded rate limits: too many concurrent jobs for this project. Limit: {self.max_concurrent_jobs}",
+                                    reason='rateLimitExceeded')
+        if job_type == 'load' and self.max_load_jobs_per_table is not None:
+            with self.lock:
+                count = self.load_jobs.get(destination, 0)
+                if count >= self.max_load_jobs_per_table:
+                    raise _google_error(403, f"Quota exceeded: Your table exceeded quota for imports or query appends per table. Table: {destination}",
+                                        reason='quotaExceeded')
+                self.load_jobs[destination] = count + 1
+
+    def _new_job(self, job_type, duration, **kwargs):
+        self._check_quotas(job_type, **kwargs)
+        with self.lock:
+            error = 'simulated job failure' if self.random.random() < self.failure_rate else None
+        job = FakeJob(self, job_type, duration, error=error, **kwargs)
+        with self.lock:
+            self.jobs[job.job_id] = job
+        return(job)
+
+    def _write(self, table_id, num_rows, num_bytes):
+        table_id = _table_id(table_id)
+        with self.lock:
+            table = self.tables.get(table_id) or FakeTable(table_id)
+            table.num_rows += num_rows
+            table.num_bytes += num_bytes
+            table.modified = datetime.now(timezone.utc)
+            self.tables[table_id] = table
+
+    def query(self, query, job_config=None, **kwargs):
+        self._call('jobs.insert')
+        dry_run = bool(getattr(job_config, 'dry_run', False))
+        destination = getattr(job_config, 'destination', None)
+        return(self._new_job('query', self._duration(self.job_time), query=query, dry_run=dry_run,
+                             destination=destination and _table_id(destination),
+                             bytes_processed=self.bytes_per_query, num_rows=self.rows_per_query))
+
+    def get_job(self, job_id, location=None, **kwargs):
+        self._call('jobs.get')
+        with self.lock:
+            job = self.jobs.get(getattr(job_id, 'job_id', job_id))
+        if job is None:
+            raise _google_error(404, f"Not found: Job {job_id}")
+        return(job._update())
+
+    def list_jobs(self, min_creation_time=None, parent_job=None, **kwargs):
+        # one page of the most recent jobs
+        self._call('jobs.list')
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return([job._update() for job in jobs if min_creation_time is None or job.created >= min_creation_time])
+
+    def load_table_from_dataframe(self, dataframe, destination, job_config=None, **kwargs):
+        self._call('jobs.insert')
+        num_bytes = int(dataframe.memory_usage(deep=False).sum())
+        return(self._new_job('load', self._duration(self.latency + num_bytes / self.load_throughput),
+                             destination=_table_id(destination), bytes_processed=0, num_rows=len(dataframe)))
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None, **kwargs):
+        self._call('jobs.insert')
+        uris = [source_uris] if isinstance(source_uris, str) else list(source_uris)
+        num_bytes = sum(self.storage._uri_bytes(uri) for uri in uris) if self.storage is not None else 0
+        return(self._new_job('load', self._duration(self.latency + num_bytes / self.load_throughput),
+                             destination=_table_id(destination), bytes_processed=0, num_rows=0))
+
+    def insert_rows_json(self, table, json_rows, row_ids=None, **kwargs):
+        # the real client serializes the rows with json.dumps, unsupported values raise the same TypeError
+        self._call('tabledata.insertAll')
+        num_bytes = len(json.dumps(list(json_rows)))
+        self._write(table, len(json_rows), num_bytes)
+        return([])
+
+    def get_table(self, table, **kwargs):
+        self._call('tables.get')
+        table_id = _table_id(table)
+        with self.lock:
+            if table_id not in self.tables:
+                raise _google_error(404, f"Not found: Table {table_id}")
+            return(self.tables[table_id])
+
+    def get_dataset(self, dataset, **kwargs):
+        self._call('datasets.get')
+        if str(dataset) not in self.datasets:
+            raise _google_error(404, f"Not found: Dataset {dataset}")
+        return(dataset)
+
+    def create_dataset(self, dataset, exists_ok=False, **kwargs):
+        self._call('datasets.insert')
+        dataset_id = getattr(dataset, 'dataset_id', dataset)
+        with self.lock:
+            self.datasets.add(f"{self.project}.{dataset_id}" if '.' not in str(dataset_id) else str(dataset_id))
+        return(dataset)
+
+    def list_tables(self, dataset, **kwargs):
+        self._call('tables.list')
+        with self.lock:
+            return([table for table_id, table in self.tables.items() if table_id.startswith(f"{dataset}.")])
+
+
+#-------------------------------
+#        storage
+#-------------------------------
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = None
+
+    @property
+    def _object(self):
+        return(self.bucket.client.objects.get((self.bucket.name, self.name)))
+
+    @property
+    def size(self):
+        return(self._object['size'] if self._object else None)
+
+    @property
+    def generation(self):
+        return(self._object['generation'] if self._object else None)
+
+    @property
+    def updated(self):
+        return(self._object['updated'] if self._object else None)
+
+    def _transfer(self, name, num_bytes):
+        client = self.bucket.client
+        # a resumable upload sends one request per chunk
+        requests = -(-num_bytes // self.chunk_size) if self.chunk_size and num_bytes else 1
+        for _ in range(requests):
+            client._call(name)
+        if client.bandwidth:
+            time.sleep(num_bytes / client.bandwidth)
+
+    def _write(self, data, num_bytes, if_generation_match=None):
+        client = self.bucket.client
+        with client.lock:
+            current = client.objects.get((self.bucket.name, self.name))
+            if if_generation_match == 0 and current is not None:
+                raise _google_error(412, f"Precondition failed: {self.name}")
+            client.objects[(self.bucket.name, self.name)] = {
+                'size': num_bytes,
+                'generation': next(client._generations),
+                'updated': datetime.now(timezone.utc),
+                'data': data if client.keep_data else None,
+            }
+
+    def _read(self):
+        obj = self._object
+        if obj is None:
+            raise _google_error(404, f"No such object: {self.bucket.name}/{self.name}")
+        return(obj['data'] if obj['data'] is not None else bytes(obj['size']))
+
+    def upload_from_filename(self, filename, **kwargs):
+        num_bytes = os.path.getsize(filename)
+        self._transfer('objects.insert', num_bytes)
+        data = None
+        if self.bucket.client.keep_data:
+            with open(filename, 'rb') as file:
+                data = file.read()
+        self._write(data, num_bytes)
+
+    def upload_from_file(self, file, size=None, **kwargs):
+        data = file.read(size) if size is not None else file.read()
+        self._transfer('objects.insert', len(data))
+        self._write(data, len(data))
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None, **kwargs):
+        data = data.encode() if isinstance(data, str) else data
+        self._transfer('objects.insert', len(data))
+        self._write(data, len(data), if_generation_match)
+
+    def download_to_filename(self, filename, **kwargs):
+        data = self._read()
+        self._transfer('objects.get', len(data))
+        with open(filename, 'wb') as file:
+            file.write(data)
+
+    def download_to_file(self, file, start=None, end=None, **kwargs):
+        data = self._read()
+        data = data[start or 0:None if end is None else end + 1]
+        self._transfer('objects.get', len(data))
+        file.write(data)
+
+    def download_as_bytes(self, **kwargs):
+        data = self._read()
+        self._transfer('objects.get', len(data))
+        return(data)
+
+    def exists(self, **kwargs):
+        self.bucket.client._call('objects.get')
+        return(self._object is not None)
+
+    def reload(self, **kwargs):
+        self.bucket.client._call('objects.get')
+        if self._object is None:
+            raise _google_error(404, f"No such object: {self.bucket.name}/{self.name}")
+
+    def delete(self, if_generation_match=None, **kwargs):
+        client = self.bucket.client
+        client._call('objects.delete')
+        with client.lock:
+            current = client.objects.get((self.bucket.name, self.name))
+            if current is None:
+                raise _google_error(404, f"No such object: {self.bucket.name}/{self.name}")
+            if if_generation_match is not None and current['generation'] != if_generation_match:
+                raise _google_error(412, f"Precondition failed: {self.name}")
+            del client.objects[(self.bucket.name, self.name)]
+
+    def compose(self, sources, **kwargs):
+        self.bucket.client._call('objects.compose')
+        data = [source._read() for source in sources]
+        self._write(b''.join(data), sum(len(d) for d in data))
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, name, **kwargs):
+        return(FakeBlob(self, name))
+
+    def get_blob(self, name, **kwargs):
+        self.client._call('objects.get')
+        blob = FakeBlob(self, name)
+        return(blob if blob._object is not None else None)
+
+    def copy_blob(self, blob, destination_bucket, new_name=None, if_generation_match=None, **kwargs):
+        self.client._call('objects.copy')
+        copy = FakeBlob(destination_bucket, new_name or blob.name)
+        obj = blob._object
+        if obj is None:
+            raise _google_error(404, f"No such object: {self.name}/{blob.name}")
+        copy._write(obj['data'], obj['size'], if_generation_match)
+        return(copy)
+
+
+class FakeStorage(_Calls):
+    '''
+    Thread-safe fake storage client
+            Parameters:
+                    project (str): project of the client
+                    latency (float): seconds spent in every API round trip
+                    bandwidth (float): bytes/s of each transfer stream, None for instant transfers
+                    keep_data (bool): if set to False, only the object sizes are kept and downloads return zeros
+                    error_rate (float): probability for an API call to fail with a 503
+                    max_request_rate (float): API calls per second, calls beyond it fail with a 429 rateLimitExceeded
+                    seed (int): seed of the random generator
+    '''
+    service = 'storage'
+
+    def __init__(self, project='bench-project', latency=0.0, bandwidth=None, keep_data=True, error_rate=0.0,
+                 max_request_rate=None, seed=None):
+        self.project = project
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.keep_data = keep_data
+        self.error_rate = error_rate
+        self.max_request_rate = max_request_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.objects = {}
+        self._generations = itertools.count(1)
+        # times of the calls of the last second
+        self._recent = deque()
+
+    def _call(self, name):
+        super()._call(name)
+        if self.max_request_rate is None:
+            return
+        now = time.time()
+        with self.lock:
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_request_rate:
+                raise _google_error(429, f"{name}: The rate of requests exceeds the rate limit. Limit: {self.max_request_rate}/s",
+                                    reason='rateLimitExceeded')
+            self._recent.append(now)
+
+    def bucket(self, bucket_name, **kwargs):
+        return(FakeBucket(self, bucket_name))
+
+    def get_bucket(self, bucket_name, **kwargs):
+        self._call('buckets.get')
+        return(FakeBucket(self, bucket_name))
+
+    def list_blobs(self, bucket_name, prefix=None, page_size=1000, **kwargs):
+        # pages are requested lazily, as the HTTP iterator of the library
+        bucket = FakeBucket(self, getattr(bucket_name, 'name', bucket_name))
+        with self.lock:
+            names = sorted(name for (b, name) in self.objects if b == bucket.name and name.startswith(prefix or ''))
+        for start in range(0, max(len(names), 1), page_size or 1000):
+            self._call('objects.list')
+            for name in names[start:start + (page_size or 1000)]:
+                yield FakeBlob(bucket, name)
+
+    def _uri_bytes(self, uri):
+        # size of the objects matched by a gs:// uri, with an optional * wildcard
+        bucket_name, _, pattern = uri[len('gs://'):].partition('/')
+        prefix = pattern.split('*')[0]
+        with self.lock:
+            return(sum(obj['size'] for (b, name), obj in self.objects.items()
+                       if b == bucket_name and name.startswith(prefix) and ('*' in pattern or name == pattern)))
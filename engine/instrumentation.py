@@ -0,0 +1,19 @@
+'''
+Instrumentation registry of the launcher
+The module lives in code/instrumentation.py so that it ships in the worker image.
+It is loaded once under the name the tools import it with, so that the launcher
+and code/tools record to the same registry when both run in the notebook.
+'''
+
+import importlib.util
+import os
+import sys
+
+if 'instrumentation' not in sys.modules:
+    _path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code', 'instrumentation.py')
+    _spec = importlib.util.spec_from_file_location('instrumentation', _path)
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules['instrumentation'] = _module
+    _spec.loader.exec_module(_module)
+
+from instrumentation import JsonFormatter, Registry, echo, instrument, registry, set_output  # noqa: E402,F401
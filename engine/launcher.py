@@ -0,0 +1,534 @@
+'''
+Concurrent fleet launcher
+Submits the instance inserts of a sweep through a bounded thread pool and polls
+all the pending zone operations together in batched requests.
+In bulk mode, workers are created by instances().bulkInsert calls sharing one
+instance template.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from string import Formatter
+
+from .instrumentation import echo, registry
+
+
+#-------------------------------
+#        compute helpers
+#-------------------------------
+
+# [START list_instances]
+def list_instances(compute, project, zone):
+    '''
+    Returns every instance of the zone, following the result pages
+    '''
+    instances = []
+    request = compute.instances().list(project=project, zone=zone)
+    while request is not None:
+        with registry.call('compute', 'instances.list'):
+            result = request.execute()
+        instances.extend(result.get('items', []))
+        request = compute.instances().list_next(request, result)
+    return(instances)
+# [END list_instances]
+
+
+# source images resolved during the session, (project, family) -> self link
+_source_images = {}
+_source_images_lock = threading.Lock()
+
+
+def get_source_image(compute, project='debian-cloud', family='debian-11', refresh=False):
+    '''
+    Returns the self link of the latest image of a family, resolved once per session
+
+            Parameters:
+                    refresh* (bool): if set to True, resolves the image again
+    '''
+    with _source_images_lock:
+        if refresh or (project, family) not in _source_images:
+            with registry.call('compute', 'images.getFromFamily'):
+                image_response = compute.images().getFromFamily(project=project, family=family).execute()
+            _source_images[(project, family)] = image_response['selfLink']
+        return(_source_images[(project, family)])
+
+
+def instance_properties(source_disk_image, startup_script, machine_type, network, service_account):
+    '''
+    Returns the instance template shared by the workers, see instance_config for the parameters
+    '''
+    return({
+        'machineType': machine_type,
+
+        # Specify the boot disk and the image to use as a source.
+        'disks': [
+            {
+                'boot': True,
+                'autoDelete': True,
+                'initializeParams': {
+                    'sourceImage': source_disk_image,
+                }
+            }
+        ],
+
+        # Specify a network interface with NAT to access the public
+        # internet.
+        'networkInterfaces': [{
+            'network': f'global/networks/{network}',
+            'accessConfigs': [
+                {'type': 'ONE_TO_ONE_NAT', 'name': 'External NAT'}
+            ]
+        }],
+
+        # Allow the instance to access cloud storage and logging.
+        'serviceAccounts': [{
+            'email': f'{service_account}',
+            'scopes': [
+                'https://www.googleapis.com/auth/devstorage.read_write',
+                'https://www.googleapis.com/auth/logging.write',
+                'https://www.googleapis.com/auth/bigquery',
+                'https://www.googleapis.com/auth/bigquery.insertdata',
+                'https://www.googleapis.com/auth/compute'
+            ]
+        }],
+
+        # Metadata is readable from the instance and allows you to
+        # pass configuration from deployment scripts to instances.
+        'metadata': {
+            'items': [{
+                # Startup script is automatically executed by the
+                # instance upon startup.
+                'key': 'startup-script',
+                'value': startup_script
+            }]
+        }
+    })
+
+
+def instance_config(zone, name, source_disk_image, startup_script, machine_type, network, service_account):
+    '''
+    Returns the body of an instances().insert request
+
+            Parameters:
+                    zone (str): compute engine zone
+                    name (str): name of the instance
+                    source_disk_image (str): self link of the boot disk image
+                    startup_script (str): startup script with its parameters already substituted
+                    machine_type (str): machine type, ex: n1-standard-1
+                    network (str): name of the VPC network
+                    service_account (str): email of the service account attached to the instance
+    '''
+    config = instance_properties(source_disk_image, startup_script, machine_type, network, service_account)
+    config['name'] = name
+    config['machineType'] = f"zones/{zone}/machineTypes/{machine_type}"
+    return(config)
+
+
+def bulk_startup_script(startup_script, workers, script_vars):
+    '''
+    Returns a single startup script for a bulkInsert call.
+    bulkInsert can't set metadata per instance, so every worker looks up its own
+    parameters from its instance name in a case statement.
+
+            Parameters:
+                    startup_script (str): startup script template, see startup-script.sh
+                    workers (dict): instance name -> dict of the worker parameters
+                    script_vars (dict): parameters shared by every worker
+    '''
+    fields = {field for _, field, _, _ in Formatter().parse(startup_script) if field}
+    values = {field: '${PE_%s}' % field for field in fields}
+    values['instance_name'] = '${INSTANCE_NAME}'
+    values.update(script_vars)
+
+    lines = [
+        '#! /bin/bash',
+        'INSTANCE_NAME=$(curl -s -H "Metadata-Flavor: Google" '
+        'http://metadata.google.internal/computeMetadata/v1/instance/name)',
+        'case "$INSTANCE_NAME" in',
+    ]
+    for name, params in workers.items():
+        assignments = ' '.join(f"PE_{key}={shlex.quote(str(value))}" for key, value in params.items())
+        lines.append(f"  {name}) {assignments} ;;")
+    lines.append('esac')
+
+    body = startup_script.format(**values)
+    if body.startswith('#!'):
+        body = body.split('\n', 1)[-1]
+    return('\n'.join(lines) + '\n' + body)
+
+
+# [START create_instance]
+def create_instance(compute, project, zone, name, bucket, startup_script, machine_type, network, service_account):
+    # Get the latest Debian image.
+    source_disk_image = get_source_image(compute)
+    config = instance_config(zone, name, source_disk_image, startup_script, machine_type, network, service_account)
+
+    with registry.call('compute', 'instances.insert'):
+        return compute.instances().insert(
+            project=project,
+            zone=zone,
+            body=config).execute()
+# [END create_instance]
+
+
+# [START delete_instance]
+def delete_instance(compute, project, zone, name):
+    with registry.call('compute', 'instances.delete'):
+        return compute.instances().delete(
+            project=project,
+            zone=zone,
+            instance=name).execute()
+# [END delete_instance]
+
+
+# [START wait_for_operation]
+def wait_for_operation(compute, project, zone, operation):
+    echo('Waiting for operation to finish...')
+    while True:
+        with registry.call('compute', 'zoneOperations.get'):
+            result = compute.zoneOperations().get(
+                project=project,
+                zone=zone,
+                operation=operation).execute()
+
+        if result['status'] == 'DONE':
+            echo("done.")
+            if 'error' in result:
+                raise Exception(result['error'])
+            return result
+
+        time.sleep(1)
+# [END wait_for_operation]
+
+
+def batch_execute(compute, requests, batch_size=500):
+    '''
+    Sends many requests in batched round trips (one HTTP batch per batch_size requests)
+
+            Parameters:
+                    requests (dict): request id -> request, ex: compute.zoneOperations().get(...)
+                    batch_size (int): max number of requests per batch
+
+            Returns:
+                    results (dict): request id -> response, or the exception raised by the request
+    '''
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = exception if exception is not None else response
+
+    ids = list(requests)
+    for start in range(0, len(ids), batch_size):
+        batch = compute.new_batch_http_request(callback=callback)
+        for request_id in ids[start:start + batch_size]:
+            batch.add(requests[request_id], request_id=request_id)
+        with registry.call('compute', 'batch', requests=len(ids[start:start + batch_size])):
+            batch.execute()
+        registry.inc('batched_requests_total', len(ids[start:start + batch_size]), service='compute')
+    return(results)
+
+
+def http_status(error):
+    '''
+    HTTP status of a googleapiclient (or fake) request error, None if it has none
+    '''
+    status = getattr(getattr(error, 'resp', None), 'status', None) or getattr(error, 'status', None)
+    try:
+        return(int(status))
+    except (TypeError, ValueError):
+        return(None)
+
+
+def is_transient(error):
+    '''
+    True for the rate limit and server errors of a request, retried instead of failing its operation
+    '''
+    status = http_status(error)
+    return(status is not None and (status == 429 or status >= 500))
+
+
+def poll_operations(compute, project, zone, operations, batch_size=500):
+    '''
+    Gets the state of many zone operations together
+
+            Parameters:
+                    operations (list[str]): names of the operations to poll
+
+            Returns:
+                    results (dict): operation name -> operation resource, or the exception raised by its request
+    '''
+    requests = {name: compute.zoneOperations().get(project=project, zone=zone, operation=name) for name in operations}
+    return(batch_execute(compute, requests, batch_size))
+
+
+def get_instances(compute, project, zone, names, batch_size=500):
+    '''
+    Gets many instances together, deleted instances map to the 404 error of their request
+
+            Returns:
+                    results (dict): instance name -> instance resource, or the exception raised by its request
+    '''
+    requests = {name: compute.instances().get(project=project, zone=zone, instance=name) for name in names}
+    return(batch_execute(compute, requests, batch_size))
+
+
+#-------------------------------
+#        launch report
+#-------------------------------
+
+class LaunchReport:
+    '''
+    Outcome of a fleet launch, one record per instance
+            Parameters:
+                    records (list[dict]): name, params, submitted, inserted, done (epoch seconds), latency (s) and error
+    '''
+    def __init__(self, records, started, finished):
+        self.records = records
+        self.started = started
+        self.finished = finished
+
+    @property
+    def launched(self):
+        return([r for r in self.records if r['error'] is None])
+
+    @property
+    def failures(self):
+        return([r for r in self.records if r['error'] is not None])
+
+    @property
+    def latencies(self):
+        return(sorted(r['latency'] for r in self.launched))
+
+    def percentile(self, q):
+        latencies = self.latencies
+        if not latencies:
+            return(None)
+        return(latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))])
+
+    @property
+    def throughput(self):
+        '''
+        Launched instances per second
+        '''
+        elapsed = self.finished - self.started
+        return(len(self.launched) / elapsed if elapsed > 0 else float('inf'))
+
+    def summary(self):
+        summary = {
+            'instances': len(self.records),
+            'launched': len(self.launched),
+            'failed': len(self.failures),
+            'wall_time_s': round(self.finished - self.started, 3),
+            'throughput_per_s': round(self.throughput, 3),
+            'latency_p50_s': self.percentile(50),
+            'latency_p99_s': self.percentile(99),
+        }
+        return(summary)
+
+    def display(self):
+        for key, value in self.summary().items():
+            echo(f"> {key}: {value}")
+        for record in self.failures:
+            echo(f"> FAILED {record['name']}: {record['error']}")
+
+
+#-------------------------------
+#        launcher
+#-------------------------------
+
+class Launcher:
+    '''
+    Launches a fleet of compute engine workers concurrently
+            Parameters:
+                    compute_factory (callable): returns a compute client, ex: lambda: googleapiclient.discovery.build('compute', 'v1')
+                        called once per thread since discovery clients are not thread safe
+                    project (str): GCP project id
+                    zone (str): compute engine zone
+                    machine_type (str): machine type of the workers
+                    network (str): name of the VPC network
+                    service_account (str): email of the workers service account
+                    max_workers* (int): max number of concurrent insert requests
+                    poll_interval* (float): delay (s) between two polls of the pending operations
+                    bulk_size* (int): max number of instances per bulkInsert call in bulk mode
+    '''
+    def __init__(self, compute_factory, project, zone, machine_type, network, service_account, max_workers=16, poll_interval=1.0, bulk_size=500):
+        self.compute_factory = compute_factory
+        self.project = project
+        self.zone = zone
+        self.machine_type = machine_type
+        self.network = network
+        self.service_account = service_account
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.bulk_size = bulk_size
+        self._template = None
+        self._local = threading.local()
+
+    @property
+    def compute(self):
+        '''
+        Compute client of the current thread
+        '''
+        if not hasattr(self._local, 'compute'):
+            self._local.compute = self.compute_factory()
+        return(self._local.compute)
+
+    def instance_name(self, worker_num, name_prefix='worker'):
+        return(f"{name_prefix}-{worker_num}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+
+    def _shared_values(self, script_vars=None):
+        # markers_uri is left empty unless the fleet is tracked by engine.monitor
+        values = {'project': self.project, 'zone': self.zone, 'markers_uri': ''}
+        values.update(script_vars or {})
+        return(values)
+
+    def _worker_values(self, params):
+        return(params if isinstance(params, dict) else {'var': params})
+
+    def worker_script(self, startup_script, instance_name, params, script_vars=None):
+        '''
+        Substitutes the startup script parameters of one worker
+
+                Parameters:
+                        params (dict, list or any): parameters of the worker, a non dict value is passed as {var}
+                            a list is a batch of parameter sets (see engine.sweep): the lines using them
+                            (ex: docker run) are repeated once per set
+                        script_vars (dict): parameters shared by every worker, ex: {'dataset': 'test'}
+        '''
+        values = self._shared_values(script_vars)
+        values['instance_name'] = instance_name
+        if not isinstance(params, list):
+            return(startup_script.format(**values, **self._worker_values(params)))
+
+        batch = [self._worker_values(p) for p in params]
+        batch_fields = set().union(*batch)
+        lines = []
+        for line in startup_script.split('\n'):
+            fields = {field for _, field, _, _ in Formatter().parse(line) if field}
+            if fields & batch_fields:
+                lines.extend(line.format(**dict(values, **p)) for p in batch)
+            else:
+                lines.append(line.format(**values))
+        return('\n'.join(lines))
+
+    def template(self, startup_script):
+        '''
+        Instance template of the workers with their startup script, built once per launcher
+        '''
+        if self._template is None:
+            self._template = instance_properties(
+                get_source_image(self.compute), '', self.machine_type, self.network, self.service_account)
+        metadata = {'items': [{'key': 'startup-script', 'value': startup_script}]}
+        return(dict(self._template, metadata=metadata))
+
+    def _insert(self, records, startup_script):
+        config = self.template(startup_script)
+        config['name'] = records[0]['name']
+        config['machineType'] = f"zones/{self.zone}/machineTypes/{self.machine_type}"
+        with registry.call('compute', 'instances.insert'):
+            operation = self.compute.instances().insert(project=self.project, zone=self.zone, body=config).execute()
+        records[0]['inserted'] = time.time()
+        return(operation)
+
+    def _bulk_insert(self, records, startup_script):
+        body = {
+            'count': len(records),
+            'instanceProperties': self.template(startup_script),
+            'perInstanceProperties': {record['name']: {} for record in records},
+        }
+        with registry.call('compute', 'instances.bulkInsert', count=len(records)):
+            operation = self.compute.instances().bulkInsert(project=self.project, zone=self.zone, body=body).execute()
+        for record in records:
+            record['inserted'] = time.time()
+        return(operation)
+
+    @registry.traced('launcher.launch')
+    def launch(self, startup_script, params, script_vars=None, name_prefix='worker', first_worker_num=1, bulk=False, phases=None):
+        '''
+        Creates one instance per parameter value and waits for every insert operation
+
+                Parameters:
+                        startup_script (str): startup script template, see startup-script.sh
+                        params (list): one entry per worker, dict of script parameters or a single {var} value
+                        script_vars* (dict): parameters shared by every worker
+                        name_prefix* (str): instance names are {name_prefix}-{worker_num}-{timestamp}
+                        bulk* (bool): if set to True, creates the workers with bulkInsert calls of bulk_size instances
+                        phases* (engine.PhaseCollector): collector of the worker phases, the workers upload their
+                            phases log to its markers and their provision phase starts at their submit time
+
+                Returns:
+                        report (LaunchReport)
+        '''
+        started = time.time()
+        if phases is not None:
+            script_vars = dict({'markers_uri': phases.markers.uri}, **(script_vars or {}))
+        records, futures, pending = [], {}, {}
+        for worker_num, value in enumerate(params, start=first_worker_num):
+            records.append({'name': self.instance_name(worker_num, name_prefix), 'params': value, 'submitted': None,
+                            'inserted': None, 'done': None, 'latency': None, 'error': None})
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if bulk:
+                if any(isinstance(r['params'], list) for r in records):
+                    raise ValueError('bulk launches run one parameter set per worker, use a task queue for batches')
+                for start in range(0, len(records), self.bulk_size):
+                    chunk = records[start:start + self.bulk_size]
+                    workers = {r['name']: self._worker_values(r['params']) for r in chunk}
+                    script = bulk_startup_script(startup_script, workers, self._shared_values(script_vars))
+                    for record in chunk:
+                        record['submitted'] = time.time()
+                    futures[executor.submit(self._bulk_insert, chunk, script)] = chunk
+            else:
+                for record in records:
+                    script = self.worker_script(startup_script, record['name'], record['params'], script_vars)
+                    record['submitted'] = time.time()
+                    futures[executor.submit(self._insert, [record], script)] = [record]
+            echo(f"> Submitted {len(records)} instances to {self.zone} in {len(futures)} requests")
+
+            while futures or pending:
+                for future in [f for f in futures if f.done()]:
+                    chunk = futures.pop(future)
+                    try:
+                        pending[future.result()['name']] = chunk
+                    except Exception as e:
+                        for record in chunk:
+                            record['error'] = str(e)
+                if pending:
+                    try:
+                        self._poll(pending)
+                    except Exception as e:
+                        # the inserts are submitted, keep tracking them and poll again on the next interval
+                        registry.retry('launch.poll')
+                        echo(f"> Operation poll failed, retrying: {e}")
+                if futures or pending:
+                    time.sleep(self.poll_interval)
+
+        report = LaunchReport(records, started, time.time())
+        if phases is not None:
+            phases.track(report)
+        echo(f"> Launched {len(report.launched)}/{len(records)} instances in {report.finished - started:.1f}s")
+        return(report)
+
+    def _poll(self, pending):
+        results = poll_operations(self.compute, self.project, self.zone, list(pending))
+        for name, result in results.items():
+            if isinstance(result, Exception) and is_transient(result):
+                # the insert went through, the operation is polled again on the next interval
+                registry.retry('launch.poll')
+                continue
+            if not isinstance(result, Exception) and result['status'] != 'DONE':
+                continue
+            for record in pending.pop(name):
+                if isinstance(result, Exception):
+                    record['error'] = str(result)
+                elif 'error' in result:
+                    record['error'] = result['error']
+                record['done'] = time.time()
+                record['latency'] = record['done'] - record['submitted']
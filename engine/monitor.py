@@ -0,0 +1,272 @@
+'''
+Fleet monitor with straggler detection and speculative re-execution
+Workers write heartbeat, start, done and failed marker objects (see
+startup-script.sh). The monitor reads them with a single listing per poll,
+launches a speculative copy of the tasks running much slower than the median,
+keeps the first copy to finish and deletes the others, and force-deletes the
+instances that stopped sending heartbeats.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrumentation import echo, instrument, registry
+from .launcher import delete_instance
+
+
+#-------------------------------
+#        markers
+#-------------------------------
+
+class LocalMarkers:
+    '''
+    Task markers stored as files, {directory}/{instance_name}/{event}
+            Parameters:
+                    directory (str): root directory of the markers
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.uri = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def mark(self, instance_name, event):
+        '''
+        Writes a marker, the local equivalent of the gsutil cp of startup-script.sh
+        '''
+        os.makedirs(os.path.join(self.directory, instance_name), exist_ok=True)
+        with open(os.path.join(self.directory, instance_name, event), 'w') as file:
+            file.write(str(int(time.time())))
+
+    def read(self):
+        '''
+        Returns instance name -> event -> time (epoch seconds)
+        '''
+        markers = {}
+        for instance_name in os.listdir(self.directory):
+            folder = os.path.join(self.directory, instance_name)
+            for event in os.listdir(folder):
+                markers.setdefault(instance_name, {})[event] = os.path.getmtime(os.path.join(folder, event))
+        return(markers)
+
+    def contents(self, event):
+        '''
+        Returns instance name -> content of its event marker, ex: the phases log of engine.phases
+        '''
+        contents = {}
+        for instance_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, instance_name, event)
+            if os.path.exists(path):
+                with open(path) as file:
+                    contents[instance_name] = file.read()
+        return(contents)
+
+
+class GCSMarkers:
+    '''
+    Task markers stored as objects, gs://{bucket_name}/{prefix}/{instance_name}/{event}
+    The object update time is the event time, so one listing reads every marker.
+            Parameters:
+                    client (object): google.cloud.storage client
+                    bucket_name (str): name of the GCS bucket
+                    prefix (str): folder of the markers in the bucket, ex: markers/sweep-1
+    '''
+    def __init__(self, client, bucket_name, prefix):
+        self.client = instrument(client, 'storage')
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.uri = f"gs://{bucket_name}/{self.prefix}"
+
+    def mark(self, instance_name, event):
+        blob = self.client.bucket(self.bucket_name).blob(f"{self.prefix}/{instance_name}/{event}")
+        blob.upload_from_string(str(int(time.time())))
+
+    def read(self):
+        markers = {}
+        for blob in self.client.list_blobs(self.bucket_name, prefix=f"{self.prefix}/"):
+            parts = blob.name[len(self.prefix) + 1:].split('/')
+            if len(parts) == 2:
+                markers.setdefault(parts[0], {})[parts[1]] = blob.updated.timestamp()
+        return(markers)
+
+    def contents(self, event, max_workers=16):
+        blobs = [blob for blob in self.client.list_blobs(self.bucket_name, prefix=f"{self.prefix}/")
+                 if blob.name.endswith(f"/{event}") and blob.name.count('/') == self.prefix.count('/') + 2]
+
+        def download(blob):
+            with registry.call('storage', 'download'):
+                return(blob.download_as_text())
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            texts = list(executor.map(download, blobs))
+        return({blob.name.split('/')[-2]: text for blob, text in zip(blobs, texts)})
+
+
+#-------------------------------
+#        monitor
+#-------------------------------
+
+class FleetMonitor:
+    '''
+    Tracks the tasks of a fleet until each of them has a finished copy
+            Parameters:
+                    launcher (engine.Launcher): launcher used for the speculative copies and the deletes
+                    markers (LocalMarkers or GCSMarkers): markers written by the workers
+                    startup_script (str): startup script template of the workers
+                    script_vars* (dict): parameters shared by every worker, markers_uri is set by the monitor
+                    straggler_factor* (float): a task running longer than straggler_factor x the median runtime gets a copy
+                    min_finished* (int): number of finished tasks before the median is trusted
+                    heartbeat_timeout* (float): delay (s) without heartbeat before an instance is deleted
+                    max_copies* (int): max number of instances launched for the same task, speculative and lost worker copies included
+                    admission* (AdmissionController): controller whose slots are freed as soon as an instance finishes or is deleted
+    '''
+    def __init__(self, launcher, markers, startup_script, script_vars=None, straggler_factor=3.0, min_finished=3,
+                 heartbeat_timeout=600.0, max_copies=2, admission=None):
+        self.launcher = launcher
+        self.markers = markers
+        self.startup_script = startup_script
+        self.script_vars = dict(script_vars or {}, markers_uri=markers.uri)
+        self.straggler_factor = straggler_factor
+        self.min_finished = min_finished
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_copies = max_copies
+        self.admission = admission
+        self.tasks = {}
+        self.instances = {}
+        self.copies = 0
+
+    def launch(self, params, **kwargs):
+        '''
+        Launches one worker per parameter value and tracks them, see Launcher.launch
+        '''
+        report = self.launcher.launch(self.startup_script, params, self.script_vars, **kwargs)
+        self.track(report)
+        return(report)
+
+    def track(self, report, task=None):
+        '''
+        Tracks the launched instances of a report, as new tasks or as copies of task
+        '''
+        for record in report.launched:
+            name = task or record['name']
+            self.tasks.setdefault(name, {'params': record['params'], 'copies': [], 'winner': None,
+                                         'state': 'running', 'runtime': None})
+            self.tasks[name]['copies'].append(record['name'])
+            self.instances[record['name']] = {'task': name, 'launched': record['done'], 'alive': True}
+
+    def _stopped(self, instance_name):
+        # the instance no longer runs its task, its admission slot is free
+        self.instances[instance_name]['alive'] = False
+        if self.admission is not None:
+            self.admission.release(instance_name)
+
+    def _delete(self, instance_name, reason):
+        echo(f"> Deleting {instance_name} ({reason})")
+        self._stopped(instance_name)
+        try:
+            delete_instance(self.launcher.compute, self.launcher.project, self.launcher.zone, instance_name)
+        except Exception as e:
+            echo(f"> Delete of {instance_name} failed: {e}")
+
+    def _copy(self, name, reason):
+        task = self.tasks[name]
+        echo(f"> Launching a copy of {name} ({reason})")
+        self.copies += 1
+        report = self.launcher.launch(self.startup_script, [task['params']], self.script_vars,
+                                      name_prefix='copy', first_worker_num=self.copies)
+        self.track(report, task=name)
+
+    def median_runtime(self):
+        runtimes = [t['runtime'] for t in self.tasks.values() if t['runtime'] is not None]
+        return(statistics.median(runtimes) if len(runtimes) >= self.min_finished else None)
+
+    def poll(self):
+        '''
+        Reads the markers once and updates every running task
+        '''
+        markers = self.markers.read()
+        now = time.time()
+
+        for name, task in self.tasks.items():
+            if task['state'] != 'running':
+                continue
+            finished = []
+            for instance_name in task['copies']:
+                events = markers.get(instance_name, {})
+                if 'done' in events:
+                    finished.append((events['done'], instance_name))
+                    self._stopped(instance_name)
+                elif 'failed' in events:
+                    self._stopped(instance_name)
+            if finished:
+                # the first copy to finish wins
+                done, winner = min(finished)
+                task['state'], task['winner'] = 'done', winner
+                task['runtime'] = done - markers[winner].get('start', done)
+                for instance_name in task['copies']:
+                    if self.instances[instance_name]['alive']:
+                        self._delete(instance_name, f"{task['winner']} finished first")
+            elif not any(self.instances[i]['alive'] for i in task['copies']):
+                task['state'] = 'failed'
+
+        median = self.median_runtime()
+        for name, task in self.tasks.items():
+            if task['state'] != 'running':
+                continue
+            alive = [i for i in task['copies'] if self.instances[i]['alive']]
+            for instance_name in list(alive):
+                events = markers.get(instance_name, {})
+                last_seen = events.get('heartbeat', self.instances[instance_name]['launched'])
+                if now - last_seen > self.heartbeat_timeout:
+                    self._delete(instance_name, f"no heartbeat for {now - last_seen:.0f}s")
+                    alive.remove(instance_name)
+            if not alive:
+                # every copy is lost, relaunched until the task has max_copies instances
+                if len(task['copies']) >= self.max_copies:
+                    task['state'] = 'failed'
+                    echo(f"> {name} FAILED, {len(task['copies'])} copies lost")
+                    continue
+                registry.retry('monitor.lost_worker')
+                self._copy(name, 'lost worker')
+                continue
+            if median is None or len(task['copies']) >= self.max_copies:
+                continue
+            starts = [markers.get(i, {}).get('start') for i in alive]
+            starts = [start for start in starts if start is not None]
+            if starts and now - min(starts) > self.straggler_factor * median:
+                registry.inc('speculative_copies_total')
+                self._copy(name, f"running {now - min(starts):.0f}s, median is {median:.0f}s")
+
+    def stats(self):
+        states = [t['state'] for t in self.tasks.values()]
+        return({
+            'tasks': len(states),
+            'running': states.count('running'),
+            'done': states.count('done'),
+            'failed': states.count('failed'),
+            'copies': sum(len(t['copies']) for t in self.tasks.values()) - len(states),
+            'median_runtime_s': self.median_runtime(),
+        })
+
+    def run(self, poll_interval=30.0, timeout=None):
+        '''
+        Polls until every task is done or failed
+
+                Returns:
+                        stats (dict)
+        '''
+        started = time.time()
+        while any(t['state'] == 'running' for t in self.tasks.values()):
+            if timeout is not None and time.time() - started > timeout:
+                echo("> Monitor timed out")
+                break
+            time.sleep(poll_interval)
+            self.poll()
+        stats = self.stats()
+        echo(f"> {stats['done']}/{stats['tasks']} tasks done, {stats['failed']} failed, {stats['copies']} copies launched")
+        return(stats)
@@ -0,0 +1,208 @@
+'''
+Worker phase telemetry
+Workers timestamp the phases of their lifetime (see startup-script.sh) in a
+phases log uploaded next to their markers. The collector reads the logs of a
+sweep in one pass, keeps the timings in a local JSON file and reports the
+per-phase breakdown and a Gantt-style timeline of the fleet.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import json
+import os
+import time
+
+from .instrumentation import echo
+from .launcher import get_instances
+from .quota import is_not_found
+
+
+# provision is measured from the launch report, the other phases by the workers
+PHASES = ('provision', 'boot', 'install', 'pull', 'run', 'delete')
+
+# timeline symbol of each phase
+SYMBOLS = {'provision': '.', 'boot': 'b', 'install': 'i', 'pull': 'p', 'run': 'R', 'delete': 'x'}
+
+
+def parse_phases(text):
+    '''
+    Returns phase -> start (epoch seconds) of a phases log, one "{phase} {epoch}" line per phase
+    '''
+    starts = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in PHASES:
+            try:
+                starts[parts[0]] = float(parts[1])
+            except ValueError:
+                continue
+    return(starts)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return(None)
+    return(values[min(len(values) - 1, int(q / 100 * len(values)))])
+
+
+#-------------------------------
+#        collector
+#-------------------------------
+
+class PhaseCollector:
+    '''
+    Phase timings of the workers of a sweep, each phase ends when the next one starts
+    The end of the delete phase is the first poll where the instance is gone, see watch_deletions.
+            Parameters:
+                    markers (LocalMarkers or GCSMarkers): markers written by the workers
+                    path* (str): local JSON file of the timings, loaded if it exists, ex: phases/sweep-1.json
+                    sweep* (str): name of the sweep, defaults to the file name
+    '''
+    def __init__(self, markers, path=None, sweep=None):
+        self.markers = markers
+        self.path = path
+        self.sweep = sweep or (os.path.splitext(os.path.basename(path))[0] if path else None)
+        self.workers = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.workers = json.load(file)['workers']
+
+    def _worker(self, instance_name):
+        return(self.workers.setdefault(instance_name, {'submitted': None, 'starts': {}, 'deleted': None, 'status': None}))
+
+    def track(self, report):
+        '''
+        Records the submit time of the launched instances, the start of their provision phase
+        '''
+        for record in report.launched:
+            self._worker(record['name'])['submitted'] = record['submitted']
+        self.save()
+
+    def collect(self):
+        '''
+        Reads the phases logs and the done/failed markers once and saves the timings
+
+                Returns:
+                        workers (dict): instance name -> submitted, starts (phase -> epoch), deleted and status
+        '''
+        logs = self.markers.contents('phases')
+        events = self.markers.read()
+        for instance_name, text in logs.items():
+            self._worker(instance_name)['starts'].update(parse_phases(text))
+        for instance_name, worker in self.workers.items():
+            instance_events = events.get(instance_name, {})
+            if 'done' in instance_events:
+                worker['status'] = 'done'
+            elif 'failed' in instance_events:
+                worker['status'] = 'failed'
+        self.save()
+        echo(f"> Collected the phases of {len(logs)} workers")
+        return(self.workers)
+
+    def watch_deletions(self, launcher):
+        '''
+        Ends the delete phase of the workers that are gone, with one batched get of the deleting instances
+
+                Parameters:
+                        launcher (engine.Launcher): launcher of the sweep
+        '''
+        deleting = [name for name, worker in self.workers.items() if 'delete' in worker['starts'] and worker['deleted'] is None]
+        if not deleting:
+            return(0)
+        now = time.time()
+        results = get_instances(launcher.compute, launcher.project, launcher.zone, deleting)
+        gone = [name for name, result in results.items() if isinstance(result, Exception) and is_not_found(result)]
+        for name in gone:
+            self.workers[name]['deleted'] = now
+        self.save()
+        return(len(gone))
+
+    def spans(self, instance_name):
+        '''
+        Returns phase -> (start, end) of a worker, the last phase without an end is left out
+        '''
+        worker = self.workers[instance_name]
+        starts = dict(worker['starts'])
+        if worker['submitted'] is not None and 'boot' in starts:
+            starts['provision'] = worker['submitted']
+        ordered = sorted((start, phase) for phase, start in starts.items())
+        spans = {}
+        for (start, phase), (end, _) in zip(ordered, ordered[1:]):
+            spans[phase] = (start, end)
+        if ordered and ordered[-1][1] == 'delete' and worker['deleted'] is not None:
+            spans['delete'] = (ordered[-1][0], worker['deleted'])
+        return(spans)
+
+    def breakdown(self):
+        '''
+        Per-phase durations (s) over the workers: count, mean, p50, p90, max and share of the total worker time
+        '''
+        durations = {phase: [] for phase in PHASES}
+        for instance_name in self.workers:
+            for phase, (start, end) in self.spans(instance_name).items():
+                durations[phase].append(end - start)
+        total = sum(sum(values) for values in durations.values())
+        rows = []
+        for phase, values in durations.items():
+            if not values:
+                continue
+            rows.append({
+                'phase': phase,
+                'workers': len(values),
+                'mean_s': round(sum(values) / len(values), 1),
+                'p50_s': round(percentile(values, 50), 1),
+                'p90_s': round(percentile(values, 90), 1),
+                'max_s': round(max(values), 1),
+                'share': round(sum(values) / total, 3) if total else None,
+            })
+        return(rows)
+
+    def timeline(self, width=80, max_workers=50):
+        '''
+        Gantt-style lines of the workers, one symbol per width-th of the sweep (see SYMBOLS)
+
+                Parameters:
+                        width* (int): number of columns of the sweep duration
+                        max_workers* (int): number of workers shown, by start time
+        '''
+        spans = {name: self.spans(name) for name in self.workers}
+        spans = {name: span for name, span in spans.items() if span}
+        if not spans:
+            return([])
+        origin = min(start for span in spans.values() for start, _ in span.values())
+        horizon = max(end for span in spans.values() for _, end in span.values()) - origin
+        scale = width / horizon if horizon > 0 else 0
+        names = sorted(spans, key=lambda name: min(start for start, _ in spans[name].values()))[:max_workers]
+        label = max(len(name) for name in names)
+        lines = []
+        for name in names:
+            row = [' '] * width
+            for phase, (start, end) in spans[name].items():
+                first = int((start - origin) * scale)
+                last = max(int((end - origin) * scale), first + 1)
+                for column in range(first, min(width, last)):
+                    row[column] = SYMBOLS[phase]
+            lines.append(f"{name.ljust(label)} |{''.join(row)}|")
+        lines.append(f"{''.ljust(label)}  0s{f'{horizon:.0f}s'.rjust(width - 2)}")
+        return(lines)
+
+    def save(self):
+        if self.path is None:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, 'w') as file:
+            json.dump({'sweep': self.sweep, 'workers': self.workers}, file, indent=1)
+
+    def display(self, width=80, max_workers=50):
+        echo(f"> Phases of {len(self.workers)} workers" + (f" ({self.sweep})" if self.sweep else ""))
+        for row in self.breakdown():
+            echo(f"> {row['phase']:<9} mean {row['mean_s']:>7.1f}s  p50 {row['p50_s']:>7.1f}s  p90 {row['p90_s']:>7.1f}s  "
+                 f"max {row['max_s']:>7.1f}s  {row['share']:>6.1%} of the worker time")
+        for line in self.timeline(width, max_workers):
+            echo(line)
+        echo("  " + "  ".join(f"{symbol} {phase}" for phase, symbol in SYMBOLS.items()))
@@ -0,0 +1,212 @@
+'''
+Quota-aware admission of workers
+Every running worker holds one slot of the VM quota. A slot is freed as soon as
+the worker instance is gone or its task is reported done, and the slot count is
+only reconciled with the full instance list from time to time.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import threading
+import time
+from collections import deque
+
+from .instrumentation import echo, registry
+from .launcher import get_instances, list_instances
+
+
+def is_not_found(error):
+    '''
+    True if error is the 404 of a googleapiclient (or fake) request
+    '''
+    status = getattr(getattr(error, 'resp', None), 'status', None) or getattr(error, 'status', None)
+    return(str(status) == '404')
+
+
+#-------------------------------
+#        admission controller
+#-------------------------------
+
+class AdmissionController:
+    '''
+    Keeps the fleet at the VM quota by admitting queued workers as soon as a slot is free
+            Parameters:
+                    compute_factory (callable): returns a compute client
+                    project (str): GCP project id
+                    zone (str): compute engine zone
+                    quota (int): max number of instances in the zone, ex: VM_QUOTAS
+                    reserve* (int): slots kept free for instances started outside of the sweep
+                    watch_interval* (float): delay (s) between two batched checks of the admitted instances
+                    reconcile_interval* (float): delay (s) between two full instance listings of the zone
+                    markers* (LocalMarkers or GCSMarkers): task markers of the workers, a slot is freed as soon as
+                        its worker writes its done or failed marker, read every marker_interval seconds
+                    marker_interval* (float): delay (s) between two readings of the markers
+    '''
+    def __init__(self, compute_factory, project, zone, quota, reserve=4, watch_interval=10.0, reconcile_interval=300.0,
+                 markers=None, marker_interval=2.0):
+        self.compute_factory = compute_factory
+        self.project = project
+        self.zone = zone
+        self.quota = quota
+        self.reserve = reserve
+        self.watch_interval = watch_interval
+        self.reconcile_interval = reconcile_interval
+        self.held = {}
+        self.external = 0
+        self.queue = deque()
+        self.markers = markers
+        self.marker_interval = marker_interval
+        self.last_reconcile = None
+        self.last_watch = 0.0
+        self.failed = []
+        self.condition = threading.Condition()
+        self._compute = None
+
+    @property
+    def compute(self):
+        if self._compute is None:
+            self._compute = self.compute_factory()
+        return(self._compute)
+
+    @property
+    def capacity(self):
+        '''
+        Number of slots available to the sweep
+        '''
+        return(max(0, self.quota - self.reserve - self.external))
+
+    @property
+    def available(self):
+        with self.condition:
+            return(max(0, self.capacity - len(self.held)))
+
+    def admit(self, name):
+        '''
+        Registers a launched worker as holding a slot
+        '''
+        with self.condition:
+            self.held[name] = time.time()
+
+    def release(self, name):
+        '''
+        Frees the slot of a worker, called when its instance is deleted or its task is reported done
+        '''
+        with self.condition:
+            if self.held.pop(name, None) is not None:
+                self.condition.notify_all()
+
+    def release_finished(self):
+        '''
+        Frees the slots of the workers whose task is reported done or failed, with a single listing of the markers
+        '''
+        events = self.markers.read()
+        with self.condition:
+            names = list(self.held)
+        for name in names:
+            if {'done', 'failed'} & set(events.get(name, {})):
+                self.release(name)
+
+    def watch(self):
+        '''
+        Frees the slots of deleted instances with a single batched round trip
+        '''
+        self.last_watch = time.time()
+        with self.condition:
+            names = list(self.held)
+        if not names:
+            return
+        results = get_instances(self.compute, self.project, self.zone, names)
+        for name, result in results.items():
+            if isinstance(result, Exception) and is_not_found(result):
+                self.release(name)
+
+    def reconcile(self):
+        '''
+        Lists the zone to count the instances started outside of the sweep and drop lost workers
+        '''
+        names = {instance['name'] for instance in list_instances(self.compute, self.project, self.zone)}
+        with self.condition:
+            self.external = len(names - set(self.held))
+            for name in [name for name in self.held if name not in names]:
+                del self.held[name]
+            self.last_reconcile = time.time()
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        '''
+        Blocks until a slot is released or timeout (s) is reached
+        '''
+        with self.condition:
+            if len(self.held) >= self.capacity:
+                self.condition.wait(timeout)
+
+    def stats(self):
+        '''
+        Queue depth and slot utilisation of the sweep
+        '''
+        with self.condition:
+            capacity = self.capacity
+            return({
+                'queued': len(self.queue),
+                'running': len(self.held),
+                'external': self.external,
+                'capacity': capacity,
+                'utilisation': round(len(self.held) / capacity, 3) if capacity else None,
+                'failed': len(self.failed),
+            })
+
+    def display(self):
+        stats = self.stats()
+        echo(f"> queued: {stats['queued']} | running: {stats['running']}/{stats['capacity']} | utilisation: {stats['utilisation']}")
+
+    def run(self, launcher, startup_script, params, script_vars=None, name_prefix='worker', bulk=False):
+        '''
+        Launches every parameter value while keeping the number of instances under the quota
+
+                Parameters:
+                        launcher (engine.Launcher): launcher used to start the workers
+                        startup_script (str): startup script template
+                        params (list): one entry per worker
+                        script_vars* (dict): parameters shared by every worker
+                        bulk* (bool): if set to True, each wave is created with bulkInsert calls
+                        A FleetMonitor tracking the same fleet with admission=self frees the slots from its own thread.
+
+                Returns:
+                        reports (list[LaunchReport]): one report per admitted wave
+        '''
+        self.queue.extend(params)
+        if self.markers is not None:
+            script_vars = dict({'markers_uri': self.markers.uri}, **(script_vars or {}))
+        reports = []
+        worker_num = 1
+        self.reconcile()
+        while self.queue:
+            free = self.available
+            if free:
+                wave = [self.queue.popleft() for _ in range(min(free, len(self.queue)))]
+                report = launcher.launch(startup_script, wave, script_vars, name_prefix, first_worker_num=worker_num, bulk=bulk)
+                worker_num += len(wave)
+                for record in report.records:
+                    if record['error'] is None:
+                        self.admit(record['name'])
+                    elif 'QUOTA_EXCEEDED' in str(record['error']):
+                        # the zone is fuller than the last reconcile said, retry the value later
+                        self.queue.append(record['params'])
+                        registry.retry('launch.quota_exceeded')
+                        self.external += 1
+                    else:
+                        self.failed.append(record)
+                        echo(f"> {record['name']} FAILED to launch, {record['params']} dropped from the queue: {record['error']}")
+                reports.append(report)
+                self.display()
+                continue
+            self.wait(self.marker_interval if self.markers is not None else self.watch_interval)
+            if self.markers is not None:
+                self.release_finished()
+            if time.time() - self.last_reconcile >= self.reconcile_interval:
+                self.reconcile()
+            elif not self.available and time.time() - self.last_watch >= self.watch_interval:
+                self.watch()
+        return(reports)
@@ -0,0 +1,243 @@
+'''
+Parameter sweep planner
+Expands named parameters into parameter sets and packs them into per-worker
+batches balanced on their historical runtimes (longest processing time first).
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import heapq
+import itertools
+import json
+import os
+import random
+import statistics
+
+from .instrumentation import echo
+
+
+def _key(params):
+    return(tuple(sorted((str(k), str(v)) for k, v in params.items())))
+
+
+#-------------------------------
+#        runtime history
+#-------------------------------
+
+class RuntimeHistory:
+    '''
+    Mean runtime (s) of the parameter sets already run
+            Parameters:
+                    runtimes (dict): parameter set key -> list of runtimes
+    '''
+    def __init__(self, runtimes=None):
+        self.runtimes = runtimes or {}
+
+    @classmethod
+    def from_file(cls, path):
+        '''
+        Loads a JSON history file: [{"params": {"var": 1}, "runtime": 12.3}, ...]
+        '''
+        history = cls()
+        if os.path.exists(path):
+            with open(path) as file:
+                for row in json.load(file):
+                    history.record(row['params'], row['runtime'])
+        return(history)
+
+    @classmethod
+    def from_table(cls, client, table_id, keys=('var',)):
+        '''
+        Loads the runtimes logged by code/main.py in BigQuery
+
+                Parameters:
+                        client (object): bigquery client
+                        table_id (str): project.dataset.table, ex: the runner_logs table
+                        keys (list[str]): columns identifying a parameter set
+        '''
+        columns = ', '.join(keys)
+        query = f"""
+            SELECT {columns}, runtime
+            FROM `{table_id}`
+            WHERE runtime IS NOT NULL
+        """
+        history = cls()
+        for row in client.query(query).result():
+            history.record({key: row[key] for key in keys}, row['runtime'])
+        return(history)
+
+    @classmethod
+    def from_markers(cls, markers, report, history=None):
+        '''
+        Runtimes of the docker runs of a launch, from the start and done markers of its workers
+
+                Parameters:
+                        markers (LocalMarkers or GCSMarkers): markers written by the workers, see engine.monitor
+                        report (LaunchReport): launch of the workers, maps the instance names to their parameters
+                        history* (RuntimeHistory): history to add the runtimes to
+        '''
+        history = history or cls()
+        events = markers.read()
+        for record in report.launched:
+            instance_events = events.get(record['name'], {})
+            # a batch has a single start and done for several parameter sets
+            if isinstance(record['params'], list) or 'start' not in instance_events or 'done' not in instance_events:
+                continue
+            params = record['params'] if isinstance(record['params'], dict) else {'var': record['params']}
+            history.record(params, instance_events['done'] - instance_events['start'])
+        return(history)
+
+    def record(self, params, runtime):
+        self.runtimes.setdefault(_key(params), []).append(float(runtime))
+
+    def save(self, path):
+        rows = [{'params': dict(key), 'runtime': runtime}
+                for key, runtimes in self.runtimes.items() for runtime in runtimes]
+        with open(path, 'w') as file:
+            json.dump(rows, file, indent=1)
+
+    def estimate(self, params, default=None):
+        runtimes = self.runtimes.get(_key(params))
+        return(statistics.mean(runtimes) if runtimes else default)
+
+    def median(self):
+        means = [statistics.mean(runtimes) for runtimes in self.runtimes.values()]
+        return(statistics.median(means) if means else None)
+
+
+#-------------------------------
+#        plan
+#-------------------------------
+
+class Plan:
+    '''
+    Per-worker batches of parameter sets
+            Parameters:
+                    batches (list[list[dict]]): parameter sets run by each worker
+                    loads (list[float]): estimated runtime (s) of each batch
+    '''
+    def __init__(self, batches, loads):
+        self.batches = batches
+        self.loads = loads
+
+    @property
+    def makespan(self):
+        '''
+        Estimated wall time of the sweep, the load of the busiest worker
+        '''
+        return(max(self.loads) if self.loads else 0.0)
+
+    @property
+    def imbalance(self):
+        '''
+        Busiest worker load over the mean load, 1.0 is a perfect balance
+        '''
+        mean = statistics.mean(self.loads) if self.loads else 0.0
+        return(self.makespan / mean if mean else 1.0)
+
+    def display(self):
+        echo(f"> {sum(len(b) for b in self.batches)} parameter sets on {len(self.batches)} workers")
+        echo(f"> Estimated sweep time: {self.makespan:.1f}s (imbalance {self.imbalance:.2f})")
+
+
+#-------------------------------
+#        sweep
+#-------------------------------
+
+class Sweep:
+    '''
+    Parameter sets of a sweep, built with Sweep.grid, Sweep.cartesian or Sweep.random
+            Parameters:
+                    params (list[dict]): parameter sets
+    '''
+    def __init__(self, params):
+        self.params = list(params)
+
+    def __len__(self):
+        return(len(self.params))
+
+    def __iter__(self):
+        return(iter(self.params))
+
+    @classmethod
+    def cartesian(cls, **values):
+        '''
+        Every combination of the given values, ex: Sweep.cartesian(var=[1, 2], model=['a', 'b'])
+        '''
+        names = list(values)
+        return(cls(dict(zip(names, combination)) for combination in itertools.product(*values.values())))
+
+    @classmethod
+    def grid(cls, **ranges):
+        '''
+        Every combination of evenly spaced values
+
+                Parameters:
+                        ranges: name -> (start, stop, num) with stop included, or a list of values
+                                ex: Sweep.grid(alpha=(0.1, 1.0, 10), var=range(19))
+        '''
+        values = {}
+        for name, spec in ranges.items():
+            if isinstance(spec, tuple) and len(spec) == 3:
+                start, stop, num = spec
+                step = (stop - start) / (num - 1) if num > 1 else 0
+                values[name] = [start + i * step for i in range(num)]
+            else:
+                values[name] = list(spec)
+        return(cls.cartesian(**values))
+
+    @classmethod
+    def random(cls, samples, seed=None, **distributions):
+        '''
+        Random parameter sets
+
+                Parameters:
+                        samples (int): number of parameter sets
+                        seed* (int): seed of the generator
+                        distributions: name -> (low, high) to draw uniformly (integers if both bounds are), or a list to draw from
+        '''
+        generator = random.Random(seed)
+
+        def draw(spec):
+            if isinstance(spec, tuple) and len(spec) == 2:
+                low, high = spec
+                if isinstance(low, int) and isinstance(high, int):
+                    return(generator.randint(low, high))
+                return(generator.uniform(low, high))
+            return(generator.choice(list(spec)))
+
+        return(cls({name: draw(spec) for name, spec in distributions.items()} for _ in range(samples)))
+
+    def plan(self, workers, history=None, default_runtime=None):
+        '''
+        Packs the parameter sets into per-worker batches, longest processing time first
+
+                Parameters:
+                        workers (int): number of workers
+                        history* (RuntimeHistory): runtimes of the previous runs
+                        default_runtime* (float): runtime of unseen parameter sets, defaults to the median of the history
+
+                Returns:
+                        plan (Plan)
+        '''
+        history = history or RuntimeHistory()
+        if default_runtime is None:
+            default_runtime = history.median() or 1.0
+        estimates = [(history.estimate(params, default_runtime), num, params) for num, params in enumerate(self.params)]
+        estimates.sort(key=lambda e: (-e[0], e[1]))
+
+        if not self.params:
+            return(Plan([], []))
+        workers = max(1, min(workers, len(self.params)))
+        batches = [[] for _ in range(workers)]
+        loads = [0.0] * workers
+        # heap of (load, worker), the next longest set goes to the least loaded worker
+        heap = [(0.0, worker) for worker in range(workers)]
+        for runtime, _, params in estimates:
+            load, worker = heapq.heappop(heap)
+            batches[worker].append(params)
+            loads[worker] = load + runtime
+            heapq.heappush(heap, (loads[worker], worker))
+        return(Plan(batches, loads))
@@ -0,0 +1,258 @@
+'''
+Shared task queue for worker agents
+Each VM boots once, then claims tasks from the queue and runs the container for
+each of them until the queue is empty (see worker-agent.sh).
+A task is one object per state: pending/, claimed/, done/ and failed/. Claiming
+a task is an atomic move from pending/ to claimed/, so two workers can never
+run the same task.
+'''
+
+#-------------------------------
+#        libraries
+#-------------------------------
+
+import json
+import math
+import os
+import random
+import time
+
+from .instrumentation import echo, instrument, registry
+
+
+def default_args(params):
+    '''
+    Docker run arguments of a task, ex: {'var': 3} -> '--var 3'
+    '''
+    return(' '.join(f"--{key} {value}" for key, value in params.items()))
+
+
+def _error_code(error):
+    # google.api_core exceptions carry the HTTP status as .code
+    return(getattr(error, 'code', None))
+
+
+#-------------------------------
+#        queue
+#-------------------------------
+
+class TaskQueue:
+    '''
+    Base class of the queue backends
+    '''
+    states = ('pending', 'claimed', 'done', 'failed')
+
+    def _task(self, task_id, params, args):
+        if not isinstance(params, dict):
+            params = {'var': params}
+        return({
+            'id': task_id,
+            'params': params,
+            'args': args.format(**params) if args else default_args(params),
+        })
+
+    def put(self, params, args=None):
+        '''
+        Adds one task per parameter set to the queue
+
+                Parameters:
+                        params (list): one entry per task, dict of parameters or a single {var} value
+                        args* (str): docker run arguments template, ex: '--var {var}', defaults to --key value pairs
+
+                Returns:
+                        task_ids (list[str])
+        '''
+        offset = self.count()
+        task_ids = []
+        for num, value in enumerate(params, start=offset + 1):
+            task = self._task(f"task-{num:06d}", value, args)
+            self._write('pending', task)
+            task_ids.append(task['id'])
+        echo(f"> {len(task_ids)} tasks added to {self.uri}")
+        return(task_ids)
+
+    def claim(self, worker):
+        '''
+        Claims a pending task for a worker, returns None once the queue is empty
+        '''
+        while True:
+            pending = self._list('pending')
+            if not pending:
+                return(None)
+            # picking at random keeps concurrent workers from racing on the same task
+            task_id = random.choice(pending)
+            task = self._move(task_id, 'pending', 'claimed')
+            if task is None:
+                # another worker claimed it first
+                registry.retry('queue.claim')
+            else:
+                task['worker'] = worker
+                task['claimed_at'] = time.time()
+                self._write('claimed', task)
+                return(task)
+
+    def complete(self, task, success=True):
+        '''
+        Moves a claimed task to done/ or failed/
+        '''
+        task['finished_at'] = time.time()
+        self._write('claimed', task)
+        self._move(task['id'], 'claimed', 'done' if success else 'failed')
+
+    def requeue(self, task):
+        '''
+        Puts a claimed task back in pending/, ex: after its worker was lost
+        '''
+        self._move(task['id'], 'claimed', 'pending')
+
+    def count(self, state=None):
+        '''
+        Number of tasks in a state, or in the queue if state is None
+        '''
+        states = [state] if state else self.states
+        return(sum(len(self._list(s)) for s in states))
+
+    def stats(self):
+        return({state: len(self._list(state)) for state in self.states})
+
+    def fleet_size(self, tasks_per_worker=1, max_workers=None):
+        '''
+        Number of workers to launch for the pending tasks
+
+                Parameters:
+                        tasks_per_worker (int): number of tasks each worker is expected to run
+                        max_workers* (int): upper bound, ex: the VM quota
+        '''
+        size = math.ceil(self.count('pending') / tasks_per_worker)
+        return(min(size, max_workers) if max_workers else size)
+
+
+class LocalTaskQueue(TaskQueue):
+    '''
+    Task queue stored in a local directory, used to test workers without GCP
+            Parameters:
+                    directory (str): root directory of the queue
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.uri = directory
+        for state in self.states:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, task_id):
+        return(os.path.join(self.directory, state, f"{task_id}.json"))
+
+    def _list(self, state):
+        return(sorted(name[:-5] for name in os.listdir(os.path.join(self.directory, state)) if name.endswith('.json')))
+
+    def _write(self, state, task):
+        path = self._path(state, task['id'])
+        with open(path + '.tmp', 'w') as file:
+            json.dump(task, file)
+        os.replace(path + '.tmp', path)
+
+    def _move(self, task_id, source, destination):
+        # rename is atomic, the losing worker gets a FileNotFoundError
+        try:
+            os.rename(self._path(source, task_id), self._path(destination, task_id))
+        except FileNotFoundError:
+            return(None)
+        with open(self._path(destination, task_id)) as file:
+            return(json.load(file))
+
+
+class GCSTaskQueue(TaskQueue):
+    '''
+    Task queue stored as objects of a GCS bucket
+            Parameters:
+                    client (object): google.cloud.storage client
+                    bucket_name (str): name of the GCS bucket
+                    prefix (str): folder of the queue in the bucket, ex: queues/sweep-1
+    '''
+    def __init__(self, client, bucket_name, prefix):
+        self.client = instrument(client, 'storage')
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip('/')
+        self.bucket = self.client.bucket(bucket_name)
+        self.uri = f"gs://{bucket_name}/{self.prefix}"
+
+    def _name(self, state, task_id):
+        return(f"{self.prefix}/{state}/{task_id}.json")
+
+    def _list(self, state):
+        blobs = self.client.list_blobs(self.bucket_name, prefix=f"{self.prefix}/{state}/")
+        return([blob.name.rsplit('/', 1)[-1][:-5] for blob in blobs if blob.name.endswith('.json')])
+
+    def _write(self, state, task):
+        self.bucket.blob(self._name(state, task['id'])).upload_from_string(
+            json.dumps(task), content_type='application/json')
+
+    def _move(self, task_id, source, destination):
+        # the copy only succeeds if the destination doesn't exist yet (generation 0),
+        # so a single worker wins the claim
+        blob = self.bucket.blob(self._name(source, task_id))
+        try:
+            blob.reload()
+            self.bucket.copy_blob(blob, self.bucket, self._name(destination, task_id), if_generation_match=0)
+        except Exception as e:
+            if _error_code(e) in (404, 412):
+                return(None)
+            raise
+        try:
+            blob.delete(if_generation_match=blob.generation)
+        except Exception as e:
+            if _error_code(e) not in (404, 412):
+                raise
+        return(json.loads(self.bucket.blob(self._name(destination, task_id)).download_as_bytes()))
+
+
+#-------------------------------
+#        agents
+#-------------------------------
+
+def run_agent(queue, worker, run):
+    '''
+    Local equivalent of worker-agent.sh: claims and runs tasks until the queue is empty
+
+            Parameters:
+                    queue (TaskQueue): task queue
+                    worker (str): name of the worker
+                    run (callable): runs one task, returns True on success
+
+            Returns:
+                    task_ids (list[str]): tasks run by the worker
+    '''
+    task_ids = []
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            return(task_ids)
+        try:
+            success = bool(run(task))
+        except Exception as e:
+            echo(f"> Task {task['id']} FAILED on {worker}: {e}")
+            success = False
+        queue.complete(task, success)
+        task_ids.append(task['id'])
+
+
+def launch_agents(launcher, queue, agent_script, tasks_per_worker=1, max_workers=None, script_vars=None, **kwargs):
+    '''
+    Launches a fleet of worker agents sized by the number of pending tasks
+
+            Parameters:
+                    launcher (engine.Launcher): launcher used to start the workers
+                    queue (GCSTaskQueue): queue read by the workers
+                    agent_script (str): worker agent startup script template, see worker-agent.sh
+                    tasks_per_worker* (int): expected number of tasks run by each worker
+                    max_workers* (int): upper bound of the fleet size, ex: VM_QUOTAS-4
+                    script_vars* (dict): other parameters of the startup script
+
+            Returns:
+                    report (LaunchReport)
+    '''
+    size = queue.fleet_size(tasks_per_worker, max_workers)
+    values = {'queue_uri': queue.uri}
+    values.update(script_vars or {})
+    echo(f"> {queue.count('pending')} pending tasks, starting {size} worker agents")
+    return(launcher.launch(agent_script, [{}] * size, values, name_prefix='agent', **kwargs))
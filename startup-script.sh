@@ -1,7 +1,29 @@
 #! /bin/bash
 sudo echo "> machine is running fine"
 
+# Task markers read by engine.monitor, left empty to disable them
+MARKERS={markers_uri}
+if [ -n "$MARKERS" ]; then
+    date +%s | gsutil -q cp - "$MARKERS/{instance_name}/heartbeat"
+    (while true; do sleep 60; date +%s | gsutil -q cp - "$MARKERS/{instance_name}/heartbeat"; done) &
+    HEARTBEAT_PID=$!
+fi
+
+# Phase timestamps read by engine.phases, the boot phase starts at the kernel boot time
+# The log is uploaded in the background next to the markers, and once more before the delete
+PHASES=/var/log/parallel-engine-phases
+UPLOADS=""
+echo "boot $(awk '/^btime/ {{print $2}}' /proc/stat)" > $PHASES
+phase() {{
+    echo "$1 $(date +%s.%N)" | tee -a $PHASES | sed 's/^/> phase /'
+    if [ -n "$MARKERS" ]; then
+        gsutil -q cp $PHASES "$MARKERS/{instance_name}/phases" &
+        UPLOADS="$UPLOADS $!"
+    fi
+}}
+
 # Docker test
+phase install
 sudo apt update
 sudo apt install --yes apt-transport-https ca-certificates curl gnupg2 software-properties-common
 curl -fsSL https://download.docker.com/linux/debian/gpg | sudo apt-key add -
@@ -9,14 +31,26 @@ sudo add-apt-repository "deb [arch=amd64] https://download.docker.com/linux/debi
 sudo apt update
 sudo apt install --yes docker-ce
 
-# Get access token
+# Get access token and pull the image
+phase pull
 docker login -u oauth2accesstoken -p "$(gcloud auth print-access-token)" https://gcr.io
+sudo docker pull gcr.io/{project}/job-runner:latest
 
 
 # Run docker container
+phase run
+if [ -n "$MARKERS" ]; then date +%s | gsutil -q cp - "$MARKERS/{instance_name}/start"; fi
 # [UPDATE HERE]
 sudo docker run gcr.io/{project}/job-runner:latest --project {project} --dataset {dataset} --var {var}
+STATUS=$?
+if [ -n "$MARKERS" ] && [ $STATUS -eq 0 ]; then date +%s | gsutil -q cp - "$MARKERS/{instance_name}/done"; fi
+if [ -n "$MARKERS" ] && [ $STATUS -ne 0 ]; then date +%s | gsutil -q cp - "$MARKERS/{instance_name}/failed"; fi
 
 
-# Delete the compute engine
-gcloud compute instances delete {instance_name} --zone {zone}
\ No newline at end of file
+# Delete the compute engine, the collector sees the end of the delete phase
+phase delete
+if [ -n "$HEARTBEAT_PID" ]; then kill $HEARTBEAT_PID; fi
+# only the phase uploads, the last upload must not be overwritten by an earlier one
+if [ -n "$UPLOADS" ]; then wait $UPLOADS; fi
+if [ -n "$MARKERS" ]; then gsutil -q cp $PHASES "$MARKERS/{instance_name}/phases"; fi
+gcloud compute instances delete {instance_name} --zone {zone}
@@ -0,0 +1,24 @@
+'''
+Import-time budget of the worker, see bench/import_time.py
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import pytest  # noqa: E402
+
+import import_time  # noqa: E402
+
+
+def test_worker_imports_within_budget():
+    pytest.importorskip("google.cloud.bigquery")
+    result = import_time.report(import_time.WORKER_IMPORTS)
+    assert result['total_ms'] <= import_time.BUDGET_MS, result['top']
+    assert result['deferred_loaded'] == []
+
+
+def test_tools_import_loads_no_deferred_module():
+    result = import_time.report("import tools", repeat=1, deferred=import_time.TOOLS_DEFERRED)
+    assert result['deferred_loaded'] == []
@@ -0,0 +1,44 @@
+#! /bin/bash
+sudo echo "> machine is running fine"
+
+# Docker install, done once per machine
+sudo apt update
+sudo apt install --yes apt-transport-https ca-certificates curl gnupg2 software-properties-common
+curl -fsSL https://download.docker.com/linux/debian/gpg | sudo apt-key add -
+sudo add-apt-repository "deb [arch=amd64] https://download.docker.com/linux/debian $(lsb_release -cs) stable"
+sudo apt update
+sudo apt install --yes docker-ce
+
+# Get access token and pull the image once
+docker login -u oauth2accesstoken -p "$(gcloud auth print-access-token)" https://gcr.io
+# [UPDATE HERE]
+IMAGE=gcr.io/{project}/job-runner:latest
+sudo docker pull $IMAGE
+
+# Claim and run tasks until the queue is empty
+QUEUE={queue_uri}
+while true; do
+    TASK=$(gsutil ls "$QUEUE/pending/" 2>/dev/null | shuf -n 1)
+    if [ -z "$TASK" ]; then
+        break
+    fi
+    ID=$(basename "$TASK")
+
+    # the copy fails if another worker already claimed the task
+    if ! gsutil -q -h "x-goog-if-generation-match:0" cp "$TASK" "$QUEUE/claimed/$ID" 2>/dev/null; then
+        continue
+    fi
+    gsutil -q rm "$TASK"
+
+    ARGS=$(gsutil cat "$QUEUE/claimed/$ID" | python3 -c 'import json, sys; print(json.load(sys.stdin)["args"])')
+    echo "> running $ID with $ARGS"
+    if sudo docker run $IMAGE $ARGS; then
+        gsutil -q mv "$QUEUE/claimed/$ID" "$QUEUE/done/$ID"
+    else
+        gsutil -q mv "$QUEUE/claimed/$ID" "$QUEUE/failed/$ID"
+    fi
+done
+
+
+# Delete the compute engine
+gcloud compute instances delete {instance_name} --zone {zone} --quiet